@@ -9,31 +9,112 @@ Future hardening steps:
 - Enforce audience and issuer checks
 - Handle token revocation (Supabase does not provide revocation list; rely on exp)
 """
+from collections import OrderedDict
 from typing import Optional
 from fastapi import Header, HTTPException, Depends
 import httpx
-from jose import jwt
+import orjson
+import jwt
+import asyncio
+import hashlib
 import os
 import time
 
 JWKS_URL = "https://" + os.getenv("SUPABASE_PROJECT_REF", "your-project-ref") + ".supabase.co/auth/v1/keys"
-_cache_jwks: dict = {"keys": None, "fetched_at": 0}
+_cache_jwks: dict = {"keys": None, "by_kid": {}, "fetched_at": 0}
 CACHE_SECONDS = 60 * 60  # 1 hour
+_jwks_lock = asyncio.Lock()  # single-flight JWKS fetches
+ALGORITHMS = ["RS256"]
 
-async def fetch_jwks() -> Optional[dict]:
-    now = time.time()
-    if _cache_jwks["keys"] and now - _cache_jwks["fetched_at"] < CACHE_SECONDS:
+# Verified tokens: blake2b(token) -> (sub, expires_at). Lets repeat requests
+# with the same bearer token skip the RSA verify until the token expires.
+_verified_tokens: "OrderedDict[bytes, tuple]" = OrderedDict()
+VERIFIED_CACHE_SIZE = 10000
+VERIFIED_CACHE_SECONDS = 5 * 60  # upper bound even if exp is further out
+
+
+def _token_digest(token: str) -> bytes:
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+
+def _get_verified_sub(digest: bytes) -> Optional[str]:
+    entry = _verified_tokens.get(digest)
+    if entry is None:
+        return None
+    sub, expires_at = entry
+    if time.time() >= expires_at:
+        _verified_tokens.pop(digest, None)
+        return None
+    _verified_tokens.move_to_end(digest)
+    return sub
+
+
+def _remember_verified(digest: bytes, sub: str, exp) -> None:
+    expires_at = time.time() + VERIFIED_CACHE_SECONDS
+    if isinstance(exp, (int, float)):
+        expires_at = min(expires_at, exp)
+    _verified_tokens[digest] = (sub, expires_at)
+    _verified_tokens.move_to_end(digest)
+    while len(_verified_tokens) > VERIFIED_CACHE_SIZE:
+        _verified_tokens.popitem(last=False)
+
+
+def _construct_keys(data: dict) -> dict:
+    """Build verification key objects once per JWKS fetch, indexed by kid."""
+    by_kid = {}
+    for k in data.get("keys", []):
+        kid = k.get("kid")
+        if not kid:
+            continue
+        try:
+            by_kid[kid] = jwt.PyJWK(k, k.get("alg", ALGORITHMS[0])).key
+        except Exception:
+            # Skip keys we cannot use (unsupported kty/alg)
+            continue
+    return by_kid
+
+
+async def fetch_jwks(force: bool = False) -> Optional[dict]:
+    """Return the JWKS document, fetching it if the cache is empty or stale.
+
+    `force` bypasses the cache (used by the background refresher).
+    """
+    if not force and _cache_jwks["keys"] and time.time() - _cache_jwks["fetched_at"] < CACHE_SECONDS:
         return _cache_jwks["keys"]
-    try:
-        async with httpx.AsyncClient(timeout=5) as client:
-            resp = await client.get(JWKS_URL)
-            resp.raise_for_status()
-            data = resp.json()
-            _cache_jwks["keys"] = data
-            _cache_jwks["fetched_at"] = now
-            return data
-    except Exception:
+    async with _jwks_lock:
+        # Another coroutine may have refreshed the cache while we waited
+        now = time.time()
+        if not force and _cache_jwks["keys"] and now - _cache_jwks["fetched_at"] < CACHE_SECONDS:
+            return _cache_jwks["keys"]
+        try:
+            async with httpx.AsyncClient(timeout=5) as client:
+                resp = await client.get(JWKS_URL)
+                resp.raise_for_status()
+                data = orjson.loads(resp.content)
+                if _cache_jwks["keys"] and data.get("keys") != _cache_jwks["keys"].get("keys"):
+                    # Keys rotated: tokens verified against the old set must be re-checked
+                    _verified_tokens.clear()
+                _cache_jwks["keys"] = data
+                _cache_jwks["by_kid"] = _construct_keys(data)
+                _cache_jwks["fetched_at"] = now
+                return data
+        except Exception:
+            return None
+
+async def jwks_refresher():
+    """Keep the JWKS cache warm so requests never pay for the fetch.
+
+    Runs until cancelled; meant to be started from the application lifespan.
+    """
+    while True:
+        await asyncio.sleep(CACHE_SECONDS / 2)
+        await fetch_jwks(force=True)
+
+async def fetch_jwks_by_kid() -> Optional[dict]:
+    """Return the cached `{kid: key}` mapping, refreshing the JWKS if stale."""
+    if await fetch_jwks() is None:
         return None
+    return _cache_jwks["by_kid"]
 
 async def get_current_user_id(authorization: Optional[str] = Header(None)) -> Optional[str]:
     """Extract user id (sub) from Supabase JWT.
@@ -43,26 +124,32 @@ async def get_current_user_id(authorization: Optional[str] = Header(None)) -> Op
     """
     if not authorization:
         return None
-    if not authorization.lower().startswith("bearer "):
+    # Only the 7-char scheme prefix is lowercased; the token is a single slice
+    if authorization[:7].lower() != "bearer ":
         raise HTTPException(status_code=401, detail="Invalid auth header format")
-    token = authorization.split(" ", 1)[1].strip()
+    token = authorization[7:].strip()
 
     # Attempt to verify using JWKS (optional fallback: decode w/out verify)
-    jwks = await fetch_jwks()
-    algorithms = ["RS256"]
+    keys_by_kid = await fetch_jwks_by_kid()
+    digest = None
+    if keys_by_kid is not None:
+        digest = _token_digest(token)
+        cached_sub = _get_verified_sub(digest)
+        if cached_sub:
+            return cached_sub
     options = {"verify_aud": False}
     try:
-        if jwks:
-            # jose supports passing key set via `jwt.get_unverified_header` and matching kid
+        if keys_by_kid is not None:
+            # Keys are pre-constructed at fetch time; pick the one matching the token's kid
             header = jwt.get_unverified_header(token)
-            key_candidates = [k for k in jwks.get("keys", []) if k.get("kid") == header.get("kid")]
-            if not key_candidates:
+            key = keys_by_kid.get(header.get("kid"))
+            if key is None:
                 raise HTTPException(status_code=401, detail="No matching JWKS key")
-            key = key_candidates[0]
-            payload = jwt.decode(token, key, algorithms=algorithms, options=options)
+            # RSA verification is CPU-bound; run it off the event loop
+            payload = await asyncio.to_thread(jwt.decode, token, key, algorithms=ALGORITHMS, options=options)
         else:
             # Fallback: unverified decoding (NOT secure; dev only)
-            payload = jwt.get_unverified_claims(token)
+            payload = jwt.decode(token, options={"verify_signature": False})
     except HTTPException:
         raise
     except Exception:
@@ -71,6 +158,8 @@ async def get_current_user_id(authorization: Optional[str] = Header(None)) -> Op
     sub = payload.get("sub")
     if not sub:
         raise HTTPException(status_code=401, detail="Token missing sub")
+    if digest is not None:
+        _remember_verified(digest, sub, payload.get("exp"))
     return sub
 
 # Convenience dependency alias
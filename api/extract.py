@@ -1,11 +1,136 @@
 """
 Extract tasks and deadlines from text/PDF content
 """
+try:
+    # Optional linear-time DFA engine; same API as `re` for what we use here
+    import re2 as _regex
+except ImportError:
+    import re as _regex
+import calendar
+import hashlib
 import re
+import unicodedata
+from collections import OrderedDict
 from typing import List
 from datetime import datetime, timedelta
+import asyncio
+import logging
+import os
+import httpx
+import orjson
 from models import Task
 
+logger = logging.getLogger(__name__)
+
+
+# French month names, accepted with or without accents
+_FRENCH_MONTH_RE = r'janvier|f[ée]vrier|mars|avril|mai|juin|juillet|ao[uû]t|septembre|octobre|novembre|d[ée]cembre'
+
+# Month number keyed on the accent-stripped prefix of the name: three letters
+# suffice except for juin/juillet, which need four.
+_MONTH_KEYS = {
+    'jan': 1, 'fev': 2, 'mar': 3, 'avr': 4, 'mai': 5, 'juin': 6,
+    'juil': 7, 'aou': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12
+}
+
+# The ISO-date task patterns fused into a single alternation so the text is
+# scanned once. Each alternative is wrapped in an outer named group, which
+# lets the parser dispatch on `match.lastgroup`. Case-insensitivity is set
+# inline with `(?i)` so the pattern compiles unchanged under both `re` and `re2`.
+#
+# Every optional separator/keyword owns the whitespace that follows it, so no
+# two `\s*` are ever adjacent: a run of spaces can only be matched one way and
+# a failed match does not backtrack through every way of splitting it.
+_TASK_RE = _regex.compile(
+    r'(?i)'
+    # TP/TD with date: "TP 1 - Due: 2025-01-15" or "TP 1 pour le 2025-01-15"
+    r'(?P<tptd>(?P<tptd_kind>TP|TD)\s+(?P<tptd_num>\d+)\s*(?:[-:]\s*)?(?:(?:Due|pour le|deadline)\s*)?(?::\s*)?(?P<tptd_date>\d{4}-\d{2}-\d{2}))'
+    # Exam with date: "Exam - Date: 2025-01-20" or "Examen le 2025-01-20"
+    r'|(?P<exam>(?:Exam|Examen)\s*(?:(?:on|le|-)\s*)?(?::\s*)?(?:Date\s*)?(?::\s*)?(?P<exam_date>\d{4}-\d{2}-\d{2}))'
+    # General homework: "Homework X - Due: 2025-01-10"
+    r'|(?P<hw>(?P<hw_kind>Homework|Devoir)\s+(?:(?P<hw_num>\d+)\s*)?(?:[-:]\s*)?(?:(?:Due|pour le)\s*)?(?::\s*)?(?P<hw_date>\d{4}-\d{2}-\d{2}))'
+)
+
+# French dates with descriptions: "20 novembre 2025: Examen partiel". Scanned
+# in its own pass: its description can itself hold an ISO-dated task
+# ("- 3 mars 2025: TP 2 pour le 2025-03-03"), and both must be reported.
+_FRENCH_TASK_RE = _regex.compile(
+    r'(?i)'
+    r'(?P<fr>[-•*]\s*(?P<fr_day>\d{1,2}(?:er)?)\s+(?P<fr_month>' + _FRENCH_MONTH_RE + r')\s+(?P<fr_year>\d{4})\s*[:：]\s*(?P<fr_desc>[^\n]+)(?:\n|$))'
+)
+
+# Days per month (February handled separately for leap years)
+_DAYS_IN_MONTH = (0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+# Keywords used to classify French-dated entries, matched as word prefixes so
+# inflected forms ("Examination", "Remises", "rendus", "présentations") count.
+# `re` (not re2) tokenizes them because re2's \w does not cover accented letters.
+_WORD_RE = re.compile(r'\w+')
+_EXAM_PREFIXES = ('exam',)
+_PROJECT_PREFIXES = ('projet', 'project', 'remise', 'rendu', 'présentation')
+
+# Every match contains a '-', '•' or '*': ISO-dated matches end with their
+# date, French entries start with their bullet. Only whitespace inside a match
+# can cross a line break, and a match has at most six tokens (e.g. "TP", "1",
+# "-", "Due", ":", date, or bullet, day, month, year, ":", description), so it
+# lies within five non-blank lines before or after a line holding one of
+# these characters. Wrapped French entries ("- 20 novembre 2025:" with the
+# description on the next line) are why the window also extends forward.
+_CANDIDATE_CHARS = ('-', '•', '*')
+_PREFILTER_CONTEXT_LINES = 5  # non-blank lines kept on each side of a candidate line
+
+
+def _month_number(name: str) -> int:
+    """Map a French month name (any case, with or without accents) to 1-12."""
+    key = unicodedata.normalize('NFD', name.lower()).encode('ascii', 'ignore').decode()
+    return _MONTH_KEYS.get(key[:3]) or _MONTH_KEYS[key[:4]]
+
+
+def _is_valid_date(year: int, month: int, day: int) -> bool:
+    """Range-check a date so `datetime(...)` never raises in the parse loop."""
+    if year < 1 or not 1 <= month <= 12 or day < 1:
+        return False
+    if month == 2 and day == 29:
+        return calendar.isleap(year)
+    return day <= _DAYS_IN_MONTH[month]
+
+
+def _candidate_windows(text: str) -> List[tuple]:
+    """
+    Return merged (start, end) offsets of the regions of `text` that can
+    contain a task match, so the regex only runs over those regions.
+    """
+    lines = text.splitlines(keepends=True)
+    offsets = []
+    offset = 0
+    for line in lines:
+        offsets.append(offset)
+        offset += len(line)
+    
+    windows = []
+    for i, line in enumerate(lines):
+        if not any(c in line for c in _CANDIDATE_CHARS):
+            continue
+        # Walk back and forward over blank lines and up to N lines of context
+        first = i
+        context = 0
+        while first > 0 and context < _PREFILTER_CONTEXT_LINES:
+            first -= 1
+            if lines[first].strip():
+                context += 1
+        last = i
+        context = 0
+        while last < len(lines) - 1 and context < _PREFILTER_CONTEXT_LINES:
+            last += 1
+            if lines[last].strip():
+                context += 1
+        start, end = offsets[first], offsets[last] + len(lines[last])
+        if windows and start <= windows[-1][1]:
+            windows[-1] = (windows[-1][0], end)
+        else:
+            windows.append((start, end))
+    return windows
+
 
 def parse_tasks_from_text(text: str, user_id: str = "demo") -> List[Task]:
     """
@@ -21,131 +146,158 @@ def parse_tasks_from_text(text: str, user_id: str = "demo") -> List[Task]:
         user_id: The user ID to associate with tasks
     
     Returns:
-        List of Task objects parsed from the text
+        List of Task objects parsed from the text. They are built with
+        `model_construct` (no validation), so `user_id` is kept as passed.
     """
     tasks = []
     
-    # Pattern for French month names
-    french_months = {
-        'janvier': 1, 'février': 2, 'fevrier': 2, 'mars': 3, 'avril': 4,
-        'mai': 5, 'juin': 6, 'juillet': 7, 'août': 8, 'aout': 8,
-        'septembre': 9, 'octobre': 10, 'novembre': 11, 'décembre': 12, 'decembre': 12
-    }
-    
-    # Pattern for task types: TP, TD, Exam, Homework, etc.
-    task_patterns = [
-        # TP/TD with date: "TP 1 - Due: 2025-01-15" or "TP 1 pour le 2025-01-15"
-        r'(TP|TD)\s+(\d+)\s*[-:]?\s*(?:Due|pour le|deadline)?\s*:?\s*(\d{4}-\d{2}-\d{2})',
-        # Exam with date: "Exam - Date: 2025-01-20" or "Examen le 2025-01-20"
-        r'(Exam|Examen)\s*(?:on|le|-)?\s*:?\s*(?:Date)?\s*:?\s*(\d{4}-\d{2}-\d{2})',
-        # General homework: "Homework X - Due: 2025-01-10"
-        r'(Homework|Devoir)\s+(\d+)?\s*[-:]?\s*(?:Due|pour le)?\s*:?\s*(\d{4}-\d{2}-\d{2})',
-        # French dates with descriptions: "20 novembre 2025: Examen partiel"
-        r'[-•*]\s*(\d{1,2}(?:er)?)\s+(janvier|février|fevrier|mars|avril|mai|juin|juillet|août|aout|septembre|octobre|novembre|décembre|decembre)\s+(\d{4})\s*[:：]\s*(.+?)(?:\n|$)',
+    windows = _candidate_windows(text)
+    matches = [
+        match
+        for pattern in (_TASK_RE, _FRENCH_TASK_RE)
+        for start, end in windows
+        for match in pattern.finditer(text, start, end)
     ]
-    
-    for pattern in task_patterns:
-        matches = re.finditer(pattern, text, re.IGNORECASE)
-        for match in matches:
-            groups = match.groups()
+    for match in matches:
+        kind = match.lastgroup
+        
+        if kind == 'fr':
+            # French date format: "20 novembre 2025: Examen partiel"
+            day = int(match.group('fr_day').lower().replace('er', ''))
+            month = _month_number(match.group('fr_month'))
+            year = int(match.group('fr_year'))
+            description = match.group('fr_desc').strip()
             
-            # Check if this is a French date pattern (4 groups: day, month, year, description)
-            if len(groups) == 4 and groups[1].lower() in french_months:
-                # French date format: "20 novembre 2025: Examen partiel"
-                day = int(groups[0].replace('er', ''))
-                month = french_months[groups[1].lower()]
-                year = int(groups[2])
-                description = groups[3].strip()
-                
-                # Determine task type from description
-                desc_lower = description.lower()
-                if 'examen' in desc_lower or 'exam' in desc_lower:
+            # Determine task type from description: an exam keyword anywhere
+            # wins over a project keyword, so only an exam ends the scan early
+            task_type = 'other'
+            priority = 'medium'
+            for word in _WORD_RE.findall(description.lower()):
+                if word.startswith(_EXAM_PREFIXES):
                     task_type = 'exam'
                     priority = 'urgent'
-                elif 'projet' in desc_lower or 'project' in desc_lower:
-                    task_type = 'project'
-                    priority = 'high'
-                elif 'remise' in desc_lower or 'rendu' in desc_lower or 'présentation' in desc_lower:
+                    break
+                if word.startswith(_PROJECT_PREFIXES):
                     task_type = 'project'
                     priority = 'high'
-                else:
-                    task_type = 'other'
-                    priority = 'medium'
-                
-                try:
-                    due_date = datetime(year, month, day, 9, 0)  # Default to 9 AM
-                except ValueError:
-                    continue
-                
-                task = Task(
-                    user_id=user_id,
-                    title=description,
-                    type=task_type,
-                    priority=priority,
-                    status='todo',
-                    due_date=due_date,
-                    estimated_duration=120
-                )
-                tasks.append(task)
-                continue
-            
-            # Original patterns (TP, TD, Exam with ISO dates)
-            # Determine task type and title
-            if groups[0].upper() in ['TP']:
-                task_type = 'homework'
-                title = f"TP {groups[1]}" if len(groups) > 1 and groups[1] else "TP"
-                priority = 'high'
-            elif groups[0].upper() in ['TD']:
-                task_type = 'homework'
-                title = f"TD {groups[1]}" if len(groups) > 1 and groups[1] else "TD"
-                priority = 'medium'
-            elif groups[0].upper() in ['EXAM', 'EXAMEN']:
-                task_type = 'exam'
-                title = "Exam"
-                priority = 'urgent'
-            else:
-                task_type = 'homework'
-                title = f"{groups[0]} {groups[1]}" if len(groups) > 1 and groups[1] else groups[0]
-                priority = 'medium'
             
-            # Extract date (last group is always the date)
-            date_str = groups[-1]
-            try:
-                due_date = datetime.fromisoformat(date_str)
-            except ValueError:
+            if not _is_valid_date(year, month, day):
                 continue
+            due_date = datetime(year, month, day, 9, 0)  # Default to 9 AM
             
-            # Create task
-            task = Task(
+            task = Task.model_construct(
                 user_id=user_id,
-                title=title,
+                title=description,
                 type=task_type,
                 priority=priority,
                 status='todo',
                 due_date=due_date,
-                estimated_duration=120  # Default 2 hours
+                estimated_duration=120
             )
             tasks.append(task)
+            continue
+        
+        # ISO-date patterns (TP, TD, Exam, Homework)
+        # Determine task type and title
+        if kind == 'tptd':
+            label = match.group('tptd_kind').upper()
+            task_type = 'homework'
+            title = f"{label} {match.group('tptd_num')}"
+            priority = 'high' if label == 'TP' else 'medium'
+            date_str = match.group('tptd_date')
+        elif kind == 'exam':
+            task_type = 'exam'
+            title = "Exam"
+            priority = 'urgent'
+            date_str = match.group('exam_date')
+        else:
+            task_type = 'homework'
+            number = match.group('hw_num')
+            title = f"{match.group('hw_kind')} {number}" if number else match.group('hw_kind')
+            priority = 'medium'
+            date_str = match.group('hw_date')
+        
+        # The regex guarantees YYYY-MM-DD; only the ranges need checking
+        year, month, day = int(date_str[:4]), int(date_str[5:7]), int(date_str[8:10])
+        if not _is_valid_date(year, month, day):
+            continue
+        due_date = datetime(year, month, day)
+        
+        # Create task (fields are regex-constrained, so skip validation)
+        task = Task.model_construct(
+            user_id=user_id,
+            title=title,
+            type=task_type,
+            priority=priority,
+            status='todo',
+            due_date=due_date,
+            estimated_duration=120  # Default 2 hours
+        )
+        tasks.append(task)
     
     return tasks
 
 
-async def extract_tasks_with_llm(text: str, user_id: str) -> List[Task]:
+# Shared client so TCP/TLS connections to OpenRouter are reused across uploads.
+# Closed from the application lifespan via `close_llm_client`.
+_llm_client = httpx.AsyncClient(
+    timeout=30,
+    limits=httpx.Limits(max_keepalive_connections=20),
+)
+
+
+async def close_llm_client() -> None:
+    await _llm_client.aclose()
+
+
+LLM_CHUNK_SIZE = 8000  # characters per LLM request
+LLM_CHUNK_OVERLAP = 400  # carried over so deadlines on a boundary are not cut
+LLM_BUDGET_SECONDS = 8  # after this, answer with the regex result instead
+LLM_MAX_CONCURRENCY = 4  # chunk requests in flight at once, across all uploads
+
+# A 500-page PDF is well over a hundred chunks; sending them all at once
+# would only trip OpenRouter's rate limits
+_llm_slots = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+# Successful LLM extractions keyed by blake2b(text), so re-uploading the same
+# document does not pay for another round-trip. Entries hold user-independent
+# field dicts; the caller's user_id is bound when tasks are rebuilt.
+_llm_results: "OrderedDict[bytes, List[dict]]" = OrderedDict()
+LLM_CACHE_SIZE = 256
+
+
+def _text_digest(text: str) -> bytes:
+    return hashlib.blake2b(text.encode(), digest_size=16).digest()
+
+
+def _chunk_text(text: str, size: int = LLM_CHUNK_SIZE, overlap: int = LLM_CHUNK_OVERLAP) -> List[str]:
     """
-    Extract tasks from text using OpenRouter LLM (free models available).
-    More intelligent than regex-based parsing.
+    Split text into overlapping windows of at most `size` characters,
+    preferring to cut at paragraph (then line) boundaries.
     """
-    import requests
-    import json
-    import os
-    from datetime import datetime
-    
-    openrouter_api_key = os.getenv("OPENROUTER_API_KEY")
-    if not openrouter_api_key:
-        print("Warning: OPENROUTER_API_KEY not configured, falling back to regex parsing")
-        return parse_tasks_from_text(text, user_id)
+    if len(text) <= size:
+        return [text]
     
-    prompt = f"""You are an academic task extraction assistant. Extract all academic tasks, deadlines, exams, and assignments from the following text.
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + size, len(text))
+        if end < len(text):
+            # Back up to the last paragraph/line break in the second half of the window
+            cut = text.rfind('\n\n', start + size // 2, end)
+            if cut == -1:
+                cut = text.rfind('\n', start + size // 2, end)
+            if cut != -1:
+                end = cut
+        chunks.append(text[start:end])
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+
+def _build_llm_prompt(text: str) -> str:
+    return f"""You are an academic task extraction assistant. Extract all academic tasks, deadlines, exams, and assignments from the following text.
 
 Text to analyze:
 {text}
@@ -171,57 +323,127 @@ Rules:
 
 Return the JSON array now:"""
 
-    try:
-        # Use OpenRouter API (supports free models)
-        response = requests.post(
-            url="https://openrouter.ai/api/v1/chat/completions",
+
+async def _llm_extract_chunk(client: httpx.AsyncClient, api_key: str, text: str, user_id: str) -> List[Task]:
+    """Send one chunk of text to OpenRouter and convert the JSON answer to tasks."""
+    # Use OpenRouter API (supports free models)
+    async with _llm_slots:
+        response = await client.post(
+            "https://openrouter.ai/api/v1/chat/completions",
             headers={
-                "Authorization": f"Bearer {openrouter_api_key}",
+                "Authorization": f"Bearer {api_key}",
                 "Content-Type": "application/json",
             },
             json={
                 "model": "google/gemini-2.0-flash-exp:free",  # Free Google Gemini model
                 "messages": [
                     {"role": "system", "content": "You are a precise academic task extraction assistant. You always return valid JSON arrays."},
-                    {"role": "user", "content": prompt}
+                    {"role": "user", "content": _build_llm_prompt(text)}
                 ],
                 "temperature": 0.3,
                 "max_tokens": 1500
             },
-            timeout=30
         )
+    
+    response.raise_for_status()
+    data = orjson.loads(response.content)
+    content = data['choices'][0]['message']['content'].strip()
+    
+    # Parse JSON response
+    tasks_data = orjson.loads(content)
+    
+    # Convert to Task objects
+    tasks = []
+    for task_dict in tasks_data:
+        due_date = None
+        if task_dict.get('due_date'):
+            try:
+                due_date = datetime.fromisoformat(task_dict['due_date'])
+            except:
+                pass
         
-        response.raise_for_status()
-        data = response.json()
-        content = data['choices'][0]['message']['content'].strip()
-        
-        # Parse JSON response
-        tasks_data = json.loads(content)
-        
-        # Convert to Task objects
-        tasks = []
-        for task_dict in tasks_data:
-            due_date = None
-            if task_dict.get('due_date'):
-                try:
-                    due_date = datetime.fromisoformat(task_dict['due_date'])
-                except:
-                    pass
-            
-            task = Task(
-                user_id=user_id,
-                title=task_dict.get('title', 'Untitled Task'),
-                type=task_dict.get('type', 'homework'),
-                priority=task_dict.get('priority', 'medium'),
-                status='todo',
-                due_date=due_date,
-                estimated_duration=task_dict.get('estimated_duration', 60)
-            )
+        task = Task(
+            user_id=user_id,
+            title=task_dict.get('title', 'Untitled Task'),
+            type=task_dict.get('type', 'homework'),
+            priority=task_dict.get('priority', 'medium'),
+            status='todo',
+            due_date=due_date,
+            estimated_duration=task_dict.get('estimated_duration', 60)
+        )
+        tasks.append(task)
+    
+    return tasks
+
+
+async def extract_tasks_with_llm(text: str, user_id: str) -> List[Task]:
+    """
+    Extract tasks from text using OpenRouter LLM (free models available).
+    More intelligent than regex-based parsing.
+    
+    Long documents are split into overlapping chunks that are sent
+    concurrently; results are merged and deduplicated by (title, due_date).
+    If any chunk's request fails, the regex parse of the whole text is
+    merged in to cover it.
+    
+    Regex parsing of the whole text runs in parallel as a hedge: if the LLM
+    has not answered within LLM_BUDGET_SECONDS, its result is returned.
+    """
+    openrouter_api_key = os.getenv("OPENROUTER_API_KEY")
+    if not openrouter_api_key:
+        logger.warning("OPENROUTER_API_KEY not configured, falling back to regex parsing")
+        return await asyncio.to_thread(parse_tasks_from_text, text, user_id)
+    
+    digest = _text_digest(text)
+    cached = _llm_results.get(digest)
+    if cached is not None:
+        _llm_results.move_to_end(digest)
+        return [Task.model_construct(user_id=user_id, **fields) for fields in cached]
+    
+    regex_task = asyncio.create_task(asyncio.to_thread(parse_tasks_from_text, text, user_id))
+    chunks = _chunk_text(text)
+    try:
+        results = await asyncio.wait_for(
+            asyncio.gather(
+                *[_llm_extract_chunk(_llm_client, openrouter_api_key, chunk, user_id) for chunk in chunks],
+                return_exceptions=True
+            ),
+            timeout=LLM_BUDGET_SECONDS
+        )
+    except asyncio.TimeoutError:
+        logger.warning("LLM extraction exceeded %ss, using regex parsing", LLM_BUDGET_SECONDS)
+        return await regex_task
+    
+    answered = []
+    for result in results:
+        if isinstance(result, BaseException):
+            logger.warning("LLM extraction error: %s", result)
+        else:
+            answered.append(result)
+    failed = len(answered) < len(results)
+    if failed:
+        # Failures (auth, rate limits, network) usually hit every chunk; the
+        # hedge has already parsed the whole text off the event loop, so its
+        # result fills in for the chunks that got no answer
+        answered.append(await regex_task)
+    else:
+        # Only drops the result: the worker thread still runs to completion
+        regex_task.cancel()
+    
+    tasks = []
+    seen = set()
+    for result in answered:
+        for task in result:
+            key = (task.title, task.due_date)
+            if key in seen:
+                continue
+            seen.add(key)
             tasks.append(task)
-        
-        return tasks
     
-    except Exception as e:
-        print(f"LLM extraction error: {e}")
-        # Fallback to regex-based parsing
-        return parse_tasks_from_text(text, user_id)
+    # Only cache complete LLM answers; partial regex fallbacks should be retried
+    if not failed:
+        _llm_results[digest] = [task.model_dump(exclude={'user_id'}) for task in tasks]
+        while len(_llm_results) > LLM_CACHE_SIZE:
+            _llm_results.popitem(last=False)
+    
+    return tasks
@@ -1,9 +1,9 @@
 """
 FastAPI main application for StudyFlow
 """
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Request
+from fastapi.responses import JSONResponse, Response
 import logging
-import traceback
 import os
 from dotenv import load_dotenv
 
@@ -12,38 +12,313 @@ load_dotenv()
 
 # Configure a module-level logger (uvicorn will usually pick this up)
 logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-from typing import List
-import PyPDF2
-import io
-from datetime import datetime, timedelta, time
+import asyncio
+import base64
+import threading
+from collections import OrderedDict
+from time import monotonic
+from typing import BinaryIO, List, Union
+import pypdfium2 as pdfium
+from datetime import date, datetime, timedelta, time, timezone
 import uuid
-import requests
+import httpx
+import orjson
+try:
+    # Optional: lets httpx multiplex concurrent requests to one host over HTTP/2
+    import h2  # noqa: F401
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
 
 from models import (
     Task, TimeBlock, PlanRequest, ExtractDeadlinesResponse,
     PlanWeekResponse, TodayTasksResponse, NextActionResponse,
-    Course, CoursesResponse, CourseResponse,
-    ProfileResponse, Profile, DocumentResponse, Document,
-    TasksResponse, MoodleSyncRequest, IcsSyncRequest, SyncResponse
+    CoursesResponse, CourseResponse,
+    ProfileResponse, DocumentResponse,
+    TasksResponse, DeleteResponse, MoodleSyncRequest, IcsSyncRequest, SyncResponse
 )
 from pydantic import BaseModel
 from typing import Optional, Any
 from icalendar import Calendar
-from auth import get_current_user_id
+from auth import get_current_user_id, fetch_jwks, jwks_refresher
 from db import db_pool
-from extract import parse_tasks_from_text, extract_tasks_with_llm
+from extract import parse_tasks_from_text, extract_tasks_with_llm, close_llm_client
 from planning import generate_plan
 
 
+# Hot-path SQL, kept as module constants so every request reuses the same
+# statement text (and thus the same entry in asyncpg's statement cache).
+
+# Task CRUD. _TASK_RETURNING is exactly the Task fields under their own
+# names, so `dict(row)` of these rows is already a complete Task dict.
+_TASK_RETURNING = (
+    'id,user_id,course_id,title,description,"type",priority,status,due_date,'
+    'estimated_duration,actual_duration,completed_at,created_at,updated_at'
+)
+
+_INSERT_TASK = f"""
+    INSERT INTO tasks (user_id, course_id, title, description, "type", priority, status, due_date, estimated_duration)
+    VALUES ($1,$2,$3,$4,$5,$6,$7,$8,$9)
+    RETURNING {_TASK_RETURNING}
+"""
+
+# Newest first; id breaks ties so pages never overlap or skip rows
+_LIST_TASKS = f"""
+    SELECT {_TASK_RETURNING}
+    FROM tasks
+    WHERE user_id = $1
+    ORDER BY created_at DESC, id DESC
+    LIMIT $2 OFFSET $3
+"""
+
+# Keyset page: seeks past the cursor on idx_tasks_user_created (migration
+# 0004) instead of scanning and discarding OFFSET rows
+_LIST_TASKS_AFTER = f"""
+    SELECT {_TASK_RETURNING}
+    FROM tasks
+    WHERE user_id = $1
+      AND (created_at, id) < ($2, $3)
+    ORDER BY created_at DESC, id DESC
+    LIMIT $4
+"""
+
+_DELETE_TASK = "DELETE FROM tasks WHERE id = $1 RETURNING id, user_id"
+
+# Status updates: completing a task stamps completed_at, reopening it to
+# 'todo' clears it, any other status leaves it alone
+_UPDATE_TASK_STATUS = f"""
+    UPDATE tasks
+    SET status = $1,
+        completed_at = CASE WHEN $1 = 'completed' THEN NOW()
+                            WHEN $1 = 'todo' THEN NULL
+                            ELSE completed_at END,
+        updated_at = NOW()
+    WHERE id = $2
+    RETURNING {_TASK_RETURNING}
+"""
+
+_INSERT_DOCUMENT = """
+    INSERT INTO documents (user_id,course_id,file_name,file_path,file_size,file_type,document_type,description)
+    VALUES ($1,$2,$3,$4,$5,$6,$7,$8)
+    RETURNING id,user_id,course_id,file_name,file_path,file_size,file_type,document_type,description,upload_date,created_at,updated_at
+"""
+
+# Joined block + task columns, prefixed so `_row_fields(row, "tb_")` and
+# `_row_fields(row, "t_")` can each pick out their half of the row
+_BLOCK_COLUMNS = """
+    tb.id AS tb_id, tb.user_id AS tb_user_id, tb.task_id AS tb_task_id,
+    tb.title AS tb_title, tb.description AS tb_description,
+    tb.start_time AS tb_start_time, tb.end_time AS tb_end_time,
+    tb.block_type AS tb_block_type, tb.is_completed AS tb_is_completed,
+    tb.created_at AS tb_created_at, tb.updated_at AS tb_updated_at,"""
+_NULL_BLOCK_COLUMNS = """
+    NULL AS tb_id, NULL AS tb_user_id, NULL AS tb_task_id,
+    NULL AS tb_title, NULL AS tb_description,
+    NULL AS tb_start_time, NULL AS tb_end_time,
+    NULL AS tb_block_type, NULL AS tb_is_completed,
+    NULL AS tb_created_at, NULL AS tb_updated_at,"""
+_TASK_COLUMNS = """
+    t.id AS t_id, t.user_id AS t_user_id, t.course_id AS t_course_id,
+    t.title AS t_title, t.description AS t_description, t."type" AS t_type,
+    t.priority AS t_priority, t.status AS t_status, t.due_date AS t_due_date,
+    t.estimated_duration AS t_estimated_duration
+"""
+_BLOCK_WITH_TASK_COLUMNS = _BLOCK_COLUMNS + _TASK_COLUMNS
+
+# "Today" is the current calendar day in the user's profile timezone (UTC if unset)
+_TODAY_BLOCKS_WITH_TASKS = """
+    WITH tz AS (
+        SELECT COALESCE((SELECT timezone FROM profiles WHERE id = $1), 'UTC') AS name
+    ), today AS (
+        SELECT date_trunc('day', now() AT TIME ZONE tz.name) AS local_start, tz.name
+        FROM tz
+    )
+    SELECT""" + _BLOCK_WITH_TASK_COLUMNS + """
+    FROM today, time_blocks tb
+    LEFT JOIN tasks t ON t.id = tb.task_id
+    WHERE tb.user_id = $1
+      AND tb.start_time >= today.local_start AT TIME ZONE today.name
+      AND tb.start_time < (today.local_start + interval '1 day') AT TIME ZONE today.name
+    ORDER BY tb.start_time ASC
+"""
+
+# Next action in one round-trip: the block in progress (with its task) if there
+# is one, otherwise the most important open task. The fallback branch uses the
+# partial index idx_tasks_next_action (migration 0002); Append runs the
+# branches in order, so it is only evaluated when no block is in progress.
+_NEXT_ACTION = """
+    (
+        SELECT""" + _BLOCK_WITH_TASK_COLUMNS + """
+        FROM time_blocks tb
+        LEFT JOIN tasks t ON t.id = tb.task_id
+        WHERE tb.user_id = $1
+          AND tb.start_time <= now()
+          AND tb.end_time > now()
+          AND tb.is_completed = false
+        ORDER BY tb.start_time ASC
+        LIMIT 1
+    )
+    UNION ALL
+    (
+        SELECT""" + _NULL_BLOCK_COLUMNS + _TASK_COLUMNS + """
+        FROM tasks t
+        WHERE t.user_id = $1
+          AND t.status NOT IN ('completed', 'cancelled')
+        ORDER BY t.priority_rank DESC NULLS LAST, t.due_date ASC NULLS LAST
+        LIMIT 1
+    )
+    LIMIT 1
+"""
+
+
+def _row_fields(row, prefix: str = "") -> dict:
+    """Map a DB record to model field names.
+
+    Queries select columns under their field names; `prefix` selects the
+    aliased columns of one side of a joined row.
+    """
+    if prefix:
+        return {key[len(prefix):]: value for key, value in row.items() if key.startswith(prefix)}
+    return dict(row)
+
+
+# Every model field with its default, so plain-dict responses have the same
+# shape as the serialized models (columns a query does not select -> default)
+_TASK_DEFAULTS = {name: None if f.is_required() else f.default for name, f in Task.model_fields.items()}
+_TIME_BLOCK_DEFAULTS = {name: None if f.is_required() else f.default for name, f in TimeBlock.model_fields.items()}
+
+
+def _task_dict(row, prefix: str = "") -> dict:
+    """Serializable Task dict for handlers that skip model instances.
+
+    Returning the encoded dict as a Response also skips FastAPI's
+    response_model validation; the row is already typed by Postgres.
+    """
+    return {**_TASK_DEFAULTS, **_row_fields(row, prefix)}
+
+
+def _time_block_dict(row, prefix: str = "") -> dict:
+    """Serializable TimeBlock dict for read paths that skip model instances."""
+    return {**_TIME_BLOCK_DEFAULTS, **_row_fields(row, prefix)}
+
+
+# Serialization rule: a handler that holds Pydantic models returns them and
+# lets FastAPI's pydantic-core fast path encode them (an app-wide
+# ORJSONResponse would be slower: model_dump() first, then orjson). A
+# handler that holds plain rows/dicts encodes them with `_dump_json` and
+# returns `_json_response`, which builds no models and skips response
+# validation entirely. Every endpoint now does the latter; response_model is
+# kept on the routes only for the OpenAPI schema.
+def _json_response(body: bytes) -> Response:
+    return Response(content=body, media_type="application/json")
+
+
+def _json_default(value):
+    # asyncpg returns its own UUID subclass, which orjson does not recognize
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    raise TypeError
+
+
+def _dump_json(content) -> bytes:
+    """orjson-encode a response body. UTC datetimes end in "Z", matching
+    Pydantic's output."""
+    return orjson.dumps(content, default=_json_default, option=orjson.OPT_UTC_Z)
+
+
+def _encode_task_cursor(row) -> str:
+    """Opaque list cursor pointing just past `row` in (created_at, id) order."""
+    raw = orjson.dumps([row['created_at'], row['id']], default=_json_default)
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def _decode_task_cursor(cursor: str) -> tuple:
+    try:
+        created_at, task_id = orjson.loads(base64.urlsafe_b64decode(cursor))
+        return datetime.fromisoformat(created_at), uuid.UUID(task_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _masked_update_sql(table: str, columns: tuple, key_column: str, returning: str) -> str:
+    """Build one static UPDATE that can change any subset of `columns`.
+
+    Parameters: $1 = key, $2 = text[] of the columns to change, then one value
+    per column in `columns` order. Columns not named in $2 keep their value
+    (so clients can still set a column to NULL explicitly), and because the
+    SQL text never varies, every update shares one cached prepared statement.
+    """
+    assignments = ",\n        ".join(
+        f"{col} = CASE WHEN '{col}' = ANY($2::text[]) THEN ${i} ELSE {col} END"
+        for i, col in enumerate(columns, start=3)
+    )
+    return f"""
+    UPDATE {table} SET
+        {assignments}
+    WHERE {key_column} = $1
+    RETURNING {returning}
+"""
+
+
+# Short-lived per-user cache for the dashboard views (/v1/tasks/today and
+# /v1/next-action), which clients poll. Entries hold the encoded JSON body.
+# Write paths call `_invalidate_user_views` so a user never waits out the TTL
+# for their own change.
+VIEW_CACHE_SECONDS = 15
+VIEW_CACHE_SIZE = 10000
+_today_cache: "OrderedDict[str, tuple]" = OrderedDict()
+_next_action_cache: "OrderedDict[str, tuple]" = OrderedDict()
+
+
+def _get_cached_view(cache: OrderedDict, user_id) -> Optional[Any]:
+    entry = cache.get(str(user_id))
+    if entry is None:
+        return None
+    response, expires_at = entry
+    if monotonic() >= expires_at:
+        cache.pop(str(user_id), None)
+        return None
+    return response
+
+
+def _cache_view(cache: OrderedDict, user_id, response) -> None:
+    cache[str(user_id)] = (response, monotonic() + VIEW_CACHE_SECONDS)
+    cache.move_to_end(str(user_id))
+    while len(cache) > VIEW_CACHE_SIZE:
+        cache.popitem(last=False)
+
+
+def _invalidate_user_views(user_id) -> None:
+    _today_cache.pop(str(user_id), None)
+    _next_action_cache.pop(str(user_id), None)
+
+
+# Shared client for the Moodle/ICS sync endpoints: keeps connections to the
+# same hosts alive between calls. With HTTP/2 the two concurrent Moodle calls
+# share one connection instead of opening a second one. Closed from the
+# application lifespan.
+_sync_client = httpx.AsyncClient(
+    http2=_HTTP2,
+    timeout=10,
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan context manager for startup and shutdown"""
-    # Startup
-    await db_pool.connect()
+    # Startup: open the pool and warm the JWKS cache concurrently; the JWKS
+    # cache is then kept fresh in the background
+    await asyncio.gather(db_pool.connect(), fetch_jwks())
+    jwks_task = asyncio.create_task(jwks_refresher())
     yield
     # Shutdown
+    jwks_task.cancel()
+    await _sync_client.aclose()
+    await close_llm_client()
     await db_pool.disconnect()
 
 
@@ -53,6 +328,14 @@ app = FastAPI(
     version="1.0.0",
     lifespan=lifespan
 )
+
+
+@app.exception_handler(Exception)
+async def unhandled_exception_handler(request: Request, exc: Exception):
+    """Last-resort 500 for errors no endpoint handled (e.g. in dependencies)"""
+    logger.error("Unhandled error on %s %s", request.method, request.url.path, exc_info=exc)
+    return JSONResponse(status_code=500, content={"detail": "Internal server error"})
+
 # =========================
 # Courses CRUD Endpoints
 # =========================
@@ -70,22 +353,11 @@ async def list_courses(user_id: Optional[str] = None, current_user_id: Optional[
             ORDER BY name ASC
         """
         rows = await db_pool.fetch(query, user_id)
-        courses = [Course(
-            id=row['id'],
-            user_id=row['user_id'],
-            name=row['name'],
-            code=row.get('code'),
-            color=row.get('color'),
-            professor=row.get('professor'),
-            credits=row.get('credits'),
-            semester=row.get('semester'),
-            description=row.get('description'),
-            created_at=row.get('created_at'),
-            updated_at=row.get('updated_at')
-        ) for row in rows]
-        return CoursesResponse(courses=courses, count=len(courses))
+        # The selected columns are exactly the Course fields
+        courses = [dict(row) for row in rows]
+        return _json_response(_dump_json({"courses": courses, "count": len(courses)}))
     except Exception as e:
-        logging.error("Error listing courses user_id=%s: %s", user_id, e)
+        logger.error("Error listing courses user_id=%s: %s", user_id, e)
         raise HTTPException(status_code=500, detail=f"Error listing courses: {e}")
 
 
@@ -105,30 +377,17 @@ async def create_course(payload: CreateCoursePayload, current_user_id: Optional[
     if current_user_id:
         payload.user_id = current_user_id
     try:
-        course_id = str(uuid.uuid4())
         query = """
-            INSERT INTO courses (id, user_id, name, code, color, professor, credits, semester, description)
-            VALUES ($1,$2,$3,$4,$5,$6,$7,$8,$9)
+            INSERT INTO courses (user_id, name, code, color, professor, credits, semester, description)
+            VALUES ($1,$2,$3,$4,$5,$6,$7,$8)
             RETURNING id, user_id, name, code, color, professor, credits,
                       semester, description, created_at, updated_at
         """
-        row = await db_pool.fetchrow(query, course_id, payload.user_id, payload.name, payload.code, payload.color, payload.professor, payload.credits, payload.semester, payload.description)
-        course = Course(
-            id=row['id'],
-            user_id=row['user_id'],
-            name=row['name'],
-            code=row.get('code'),
-            color=row.get('color'),
-            professor=row.get('professor'),
-            credits=row.get('credits'),
-            semester=row.get('semester'),
-            description=row.get('description'),
-            created_at=row.get('created_at'),
-            updated_at=row.get('updated_at')
-        )
-        return CourseResponse(course=course)
+        row = await db_pool.fetchrow(query, payload.user_id, payload.name, payload.code, payload.color, payload.professor, payload.credits, payload.semester, payload.description)
+        # RETURNING lists exactly the Course fields
+        return _json_response(_dump_json({"course": dict(row)}))
     except Exception as e:
-        logging.error("Error creating course user_id=%s name=%s: %s", payload.user_id, payload.name, e)
+        logger.error("Error creating course user_id=%s name=%s: %s", payload.user_id, payload.name, e)
         raise HTTPException(status_code=500, detail=f"Error creating course: {e}")
 
 
@@ -142,62 +401,47 @@ class UpdateCoursePayload(BaseModel):
     description: Optional[str] = None
 
 
+_COURSE_UPDATE_COLUMNS = tuple(UpdateCoursePayload.model_fields)
+_UPDATE_COURSE = _masked_update_sql(
+    "courses", _COURSE_UPDATE_COLUMNS, "id",
+    "id, user_id, name, code, color, professor, credits, semester, description, created_at, updated_at",
+)
+
+
 @app.put("/v1/courses/{course_id}", response_model=CourseResponse)
 async def update_course(course_id: str, payload: UpdateCoursePayload, current_user_id: Optional[str] = Depends(get_current_user_id)):
     try:
-        # Build dynamic update set
-        fields = []
-        values = []
-        idx = 1
-        for key, value in payload.dict(exclude_unset=True).items():
-            fields.append(f"{key} = ${idx}")
-            values.append(value)
-            idx += 1
-        if not fields:
+        # Only the fields the client sent are changed; the statement itself is fixed
+        data = {key: payload.__dict__[key] for key in payload.model_fields_set}
+        if not data:
             raise HTTPException(status_code=400, detail="No fields to update")
-        # Append course_id
-        values.append(course_id)
-        query = f"""
-            UPDATE courses SET {', '.join(fields)} WHERE id = ${idx}
-            RETURNING id, user_id, name, code, color, professor, credits,
-                      semester, description, created_at, updated_at
-        """
-        row = await db_pool.fetchrow(query, *values)
+        values = [data.get(col) for col in _COURSE_UPDATE_COLUMNS]
+        row = await db_pool.fetchrow(_UPDATE_COURSE, course_id, list(data), *values)
         if not row:
             raise HTTPException(status_code=404, detail="Course not found")
-        course = Course(
-            id=row['id'],
-            user_id=row['user_id'],
-            name=row['name'],
-            code=row.get('code'),
-            color=row.get('color'),
-            professor=row.get('professor'),
-            credits=row.get('credits'),
-            semester=row.get('semester'),
-            description=row.get('description'),
-            created_at=row.get('created_at'),
-            updated_at=row.get('updated_at')
-        )
-        return CourseResponse(course=course)
+        # RETURNING lists exactly the Course fields
+        return _json_response(_dump_json({"course": dict(row)}))
     except HTTPException:
         raise
     except Exception as e:
-        logging.error("Error updating course id=%s: %s", course_id, e)
+        logger.error("Error updating course id=%s: %s", course_id, e)
         raise HTTPException(status_code=500, detail=f"Error updating course: {e}")
 
 
-@app.delete("/v1/courses/{course_id}")
+@app.delete("/v1/courses/{course_id}", response_model=DeleteResponse)
 async def delete_course(course_id: str, current_user_id: Optional[str] = Depends(get_current_user_id)):
     try:
-        query = "DELETE FROM courses WHERE id = $1 RETURNING id"
+        query = "DELETE FROM courses WHERE id = $1 RETURNING id, user_id"
         row = await db_pool.fetchrow(query, course_id)
         if not row:
             raise HTTPException(status_code=404, detail="Course not found")
-        return {"deleted": True, "id": course_id}
+        # ON DELETE SET NULL rewrites the course_id of the user's tasks
+        _invalidate_user_views(row['user_id'])
+        return _json_response(_dump_json({"deleted": True, "id": course_id}))
     except HTTPException:
         raise
     except Exception as e:
-        logging.error("Error deleting course id=%s: %s", course_id, e)
+        logger.error("Error deleting course id=%s: %s", course_id, e)
         raise HTTPException(status_code=500, detail=f"Error deleting course: {e}")
 
 # =========================
@@ -231,19 +475,12 @@ async def get_profile(current_user_id: Optional[str] = Depends(get_current_user_
             except Exception:
                 # If insert fails (permissions/constraints), fall back to 404
                 raise HTTPException(status_code=404, detail="Profile not found")
-        profile = Profile(
-            id=row['id'], email=row.get('email'), full_name=row.get('full_name'),
-            avatar_url=row.get('avatar_url'), timezone=row.get('timezone'),
-            study_hours_per_day=row.get('study_hours_per_day'),
-            preferred_study_start_time=row.get('preferred_study_start_time'),
-            preferred_study_end_time=row.get('preferred_study_end_time'),
-            created_at=row.get('created_at'), updated_at=row.get('updated_at')
-        )
-        return ProfileResponse(profile=profile)
+        # The selected columns are exactly the Profile fields
+        return _json_response(_dump_json({"profile": dict(row)}))
     except HTTPException:
         raise
     except Exception as e:
-        logging.error("Error fetching profile user_id=%s: %s", user_id, e)
+        logger.error("Error fetching profile user_id=%s: %s", user_id, e)
         raise HTTPException(status_code=500, detail="Error fetching profile")
 
 class UpdateProfilePayload(BaseModel):
@@ -257,6 +494,14 @@ class UpdateProfilePayload(BaseModel):
     preferred_study_start_time: Optional[Any] = None
     preferred_study_end_time: Optional[Any] = None
 
+# user_id identifies the row and is never updated
+_PROFILE_UPDATE_COLUMNS = tuple(f for f in UpdateProfilePayload.model_fields if f != 'user_id')
+_UPDATE_PROFILE = _masked_update_sql(
+    "profiles", _PROFILE_UPDATE_COLUMNS, "id",
+    "id, email, full_name, avatar_url, timezone, study_hours_per_day, "
+    "preferred_study_start_time, preferred_study_end_time, created_at, updated_at",
+)
+
 @app.patch("/v1/profile", response_model=ProfileResponse)
 async def update_profile(payload: UpdateProfilePayload, current_user_id: Optional[str] = Depends(get_current_user_id), user_id: Optional[str] = None):
     # Determine effective user_id: token > query > payload
@@ -290,10 +535,8 @@ async def update_profile(payload: UpdateProfilePayload, current_user_id: Optiona
             # Unknown type
             raise HTTPException(status_code=422, detail="Invalid time value type")
 
-        fields = []
-        values = []
-        idx = 1
-        data = payload.dict(exclude_unset=True)
+        # Flat payload: read the set fields directly instead of a model dump
+        data = {key: payload.__dict__[key] for key in payload.model_fields_set}
         # Remove user_id from update set (we don't update the primary key)
         if 'user_id' in data:
             data.pop('user_id')
@@ -303,34 +546,21 @@ async def update_profile(payload: UpdateProfilePayload, current_user_id: Optiona
         if 'preferred_study_end_time' in data:
             data['preferred_study_end_time'] = to_time(data['preferred_study_end_time'])
 
-        for k, v in data.items():
-            fields.append(f"{k} = ${idx}")
-            values.append(v)
-            idx += 1
-        if not fields:
+        if not data:
             raise HTTPException(status_code=400, detail="No fields to update")
-        values.append(effective_user_id)
-        query = f"""
-            UPDATE profiles SET {', '.join(fields)} WHERE id = ${idx}
-            RETURNING id, email, full_name, avatar_url, timezone, study_hours_per_day,
-                      preferred_study_start_time, preferred_study_end_time, created_at, updated_at
-        """
-        row = await db_pool.fetchrow(query, *values)
+        values = [data.get(col) for col in _PROFILE_UPDATE_COLUMNS]
+        row = await db_pool.fetchrow(_UPDATE_PROFILE, effective_user_id, list(data), *values)
         if not row:
             raise HTTPException(status_code=404, detail="Profile not found")
-        profile = Profile(
-            id=row['id'], email=row.get('email'), full_name=row.get('full_name'),
-            avatar_url=row.get('avatar_url'), timezone=row.get('timezone'),
-            study_hours_per_day=row.get('study_hours_per_day'),
-            preferred_study_start_time=row.get('preferred_study_start_time'),
-            preferred_study_end_time=row.get('preferred_study_end_time'),
-            created_at=row.get('created_at'), updated_at=row.get('updated_at')
-        )
-        return ProfileResponse(profile=profile)
+        # The cached today view is bounded by the profile timezone
+        if 'timezone' in data:
+            _invalidate_user_views(effective_user_id)
+        # The selected columns are exactly the Profile fields
+        return _json_response(_dump_json({"profile": dict(row)}))
     except HTTPException:
         raise
     except Exception as e:
-        logging.error("Error updating profile user_id=%s: %s", user_id, e)
+        logger.error("Error updating profile user_id=%s: %s", user_id, e)
         raise HTTPException(status_code=500, detail="Error updating profile")
 
 # =========================
@@ -355,22 +585,12 @@ async def create_task(payload: CreateTaskPayload, current_user_id: Optional[str]
     if not payload.user_id:
         raise HTTPException(status_code=400, detail="Missing user_id")
     try:
-        task_id = str(uuid.uuid4())
-        query = """
-            INSERT INTO tasks (id, user_id, course_id, title, description, "type", priority, status, due_date, estimated_duration)
-            VALUES ($1,$2,$3,$4,$5,$6,$7,$8,$9,$10)
-            RETURNING id,user_id,course_id,title,description,"type",priority,status,due_date,estimated_duration,actual_duration,completed_at,created_at,updated_at
-        """
-        row = await db_pool.fetchrow(query, task_id, payload.user_id, payload.course_id, payload.title, payload.description, payload.type, payload.priority, payload.status, payload.due_date, payload.estimated_duration)
-        task = Task(
-            id=row['id'], user_id=row['user_id'], course_id=row.get('course_id'), title=row['title'], description=row.get('description'),
-            type=row.get('type') if row.get('type') is not None else row.get('task_type'), priority=row.get('priority'), status=row.get('status'),
-            due_date=row.get('due_date'), estimated_duration=row.get('estimated_duration'), actual_duration=row.get('actual_duration'),
-            completed_at=row.get('completed_at'), created_at=row.get('created_at'), updated_at=row.get('updated_at')
-        )
-        return task
+        # id comes from the column default, in the same round-trip
+        row = await db_pool.fetchrow(_INSERT_TASK, payload.user_id, payload.course_id, payload.title, payload.description, payload.type, payload.priority, payload.status, payload.due_date, payload.estimated_duration)
+        _invalidate_user_views(row['user_id'])
+        return _json_response(_dump_json(dict(row)))
     except Exception as e:
-        logging.error("Error creating task user_id=%s title=%s: %s", payload.user_id, payload.title, e)
+        logger.error("Error creating task user_id=%s title=%s: %s", payload.user_id, payload.title, e)
         raise HTTPException(status_code=500, detail="Error creating task")
 
 class UpdateTaskPayload(BaseModel):
@@ -383,54 +603,39 @@ class UpdateTaskPayload(BaseModel):
     estimated_duration: Optional[int] = None
     course_id: Optional[str] = None
 
+_TASK_UPDATE_COLUMNS = tuple(UpdateTaskPayload.model_fields)
+_UPDATE_TASK = _masked_update_sql("tasks", _TASK_UPDATE_COLUMNS, "id", _TASK_RETURNING)
+
 @app.patch("/v1/tasks/{task_id}", response_model=Task)
 async def update_task(task_id: str, payload: UpdateTaskPayload, current_user_id: Optional[str] = Depends(get_current_user_id)):
     try:
-        # Build dynamic update set
-        fields = []
-        values = []
-        idx = 1
-        mapping = {"type": '"type"'}
-        for key, value in payload.dict(exclude_unset=True).items():
-            column = mapping.get(key, key)
-            fields.append(f"{column} = ${idx}")
-            values.append(value)
-            idx += 1
-        if not fields:
+        fields_set = payload.model_fields_set
+        if not fields_set:
             raise HTTPException(status_code=400, detail="No fields to update")
-        values.append(task_id)
-        query = f"""
-            UPDATE tasks SET {', '.join(fields)} WHERE id = ${idx}
-            RETURNING id,user_id,course_id,title,description,"type",priority,status,due_date,estimated_duration,actual_duration,completed_at,created_at,updated_at
-        """
-        row = await db_pool.fetchrow(query, *values)
+        values = [getattr(payload, col) for col in _TASK_UPDATE_COLUMNS]
+        row = await db_pool.fetchrow(_UPDATE_TASK, task_id, list(fields_set), *values)
         if not row:
             raise HTTPException(status_code=404, detail="Task not found")
-        task = Task(
-            id=row['id'], user_id=row['user_id'], course_id=row.get('course_id'), title=row['title'], description=row.get('description'),
-            type=row.get('type') if row.get('type') is not None else row.get('task_type'), priority=row.get('priority'), status=row.get('status'),
-            due_date=row.get('due_date'), estimated_duration=row.get('estimated_duration'), actual_duration=row.get('actual_duration'),
-            completed_at=row.get('completed_at'), created_at=row.get('created_at'), updated_at=row.get('updated_at')
-        )
-        return task
+        _invalidate_user_views(row['user_id'])
+        return _json_response(_dump_json(dict(row)))
     except HTTPException:
         raise
     except Exception as e:
-        logging.error("Error updating task id=%s: %s", task_id, e)
+        logger.error("Error updating task id=%s: %s", task_id, e)
         raise HTTPException(status_code=500, detail="Error updating task")
 
-@app.delete("/v1/tasks/{task_id}")
+@app.delete("/v1/tasks/{task_id}", response_model=DeleteResponse)
 async def delete_task(task_id: str):
     try:
-        query = "DELETE FROM tasks WHERE id = $1 RETURNING id"
-        row = await db_pool.fetchrow(query, task_id)
+        row = await db_pool.fetchrow(_DELETE_TASK, task_id)
         if not row:
             raise HTTPException(status_code=404, detail="Task not found")
-        return {"deleted": True, "id": task_id}
+        _invalidate_user_views(row['user_id'])
+        return _json_response(_dump_json({"deleted": True, "id": task_id}))
     except HTTPException:
         raise
     except Exception as e:
-        logging.error("Error deleting task id=%s: %s", task_id, e)
+        logger.error("Error deleting task id=%s: %s", task_id, e)
         raise HTTPException(status_code=500, detail="Error deleting task")
 
 class TaskStatusPayload(BaseModel):
@@ -439,54 +644,43 @@ class TaskStatusPayload(BaseModel):
 @app.patch("/v1/tasks/{task_id}/status", response_model=Task)
 async def update_task_status(task_id: str, payload: TaskStatusPayload):
     try:
-        extra = "completed_at = NOW()," if payload.status == 'completed' else "completed_at = NULL," if payload.status == 'todo' else ""
-        query = f"""
-            UPDATE tasks SET status = $1, {extra} updated_at = NOW()
-            WHERE id = $2
-            RETURNING id,user_id,course_id,title,description,"type",priority,status,due_date,estimated_duration,actual_duration,completed_at,created_at,updated_at
-        """
-        row = await db_pool.fetchrow(query, payload.status, task_id)
+        row = await db_pool.fetchrow(_UPDATE_TASK_STATUS, payload.status, task_id)
         if not row:
             raise HTTPException(status_code=404, detail="Task not found")
-        task = Task(
-            id=row['id'], user_id=row['user_id'], course_id=row.get('course_id'), title=row['title'], description=row.get('description'),
-            type=row.get('type') if row.get('type') is not None else row.get('task_type'), priority=row.get('priority'), status=row.get('status'),
-            due_date=row.get('due_date'), estimated_duration=row.get('estimated_duration'), actual_duration=row.get('actual_duration'),
-            completed_at=row.get('completed_at'), created_at=row.get('created_at'), updated_at=row.get('updated_at')
-        )
-        return task
+        _invalidate_user_views(row['user_id'])
+        return _json_response(_dump_json(dict(row)))
     except HTTPException:
         raise
     except Exception as e:
-        logging.error("Error updating task status id=%s: %s", task_id, e)
+        logger.error("Error updating task status id=%s: %s", task_id, e)
         raise HTTPException(status_code=500, detail="Error updating task status")
 
+# Upper bound on one page of /v1/tasks: the whole page is held in memory and
+# encoded in one piece, so larger requests are clamped (use `next_cursor`)
+LIST_TASKS_MAX_LIMIT = 500
+
 # List tasks endpoint
 @app.get("/v1/tasks", response_model=TasksResponse)
-async def list_tasks(user_id: Optional[str] = None, current_user_id: Optional[str] = Depends(get_current_user_id), limit: int = 100, offset: int = 0):
+async def list_tasks(user_id: Optional[str] = None, current_user_id: Optional[str] = Depends(get_current_user_id), limit: int = 100, offset: int = 0, cursor: Optional[str] = None):
     if current_user_id:
         user_id = current_user_id
     if not user_id:
         raise HTTPException(status_code=400, detail="Missing user_id")
+    limit = min(limit, LIST_TASKS_MAX_LIMIT)
     try:
-        query = """
-            SELECT id,user_id,course_id,title,description,"type",priority,status,due_date,estimated_duration,
-                   actual_duration,completed_at,created_at,updated_at
-            FROM tasks
-            WHERE user_id = $1
-            ORDER BY created_at DESC
-            LIMIT $2 OFFSET $3
-        """
-        rows = await db_pool.fetch(query, user_id, limit, offset)
-        tasks = [Task(
-            id=r['id'], user_id=r['user_id'], course_id=r.get('course_id'), title=r['title'], description=r.get('description'),
-            type=r.get('type') if r.get('type') is not None else r.get('task_type'), priority=r.get('priority'), status=r.get('status'),
-            due_date=r.get('due_date'), estimated_duration=r.get('estimated_duration'), actual_duration=r.get('actual_duration'),
-            completed_at=r.get('completed_at'), created_at=r.get('created_at'), updated_at=r.get('updated_at')
-        ) for r in rows]
-        return TasksResponse(tasks=tasks, count=len(tasks))
+        if cursor:
+            after_created_at, after_id = _decode_task_cursor(cursor)
+            rows = await db_pool.fetch(_LIST_TASKS_AFTER, user_id, after_created_at, after_id, limit)
+        else:
+            # OFFSET paging is kept for existing clients
+            rows = await db_pool.fetch(_LIST_TASKS, user_id, limit, offset)
+        tasks = [dict(r) for r in rows]
+        next_cursor = _encode_task_cursor(rows[-1]) if rows and len(rows) == limit else None
+        return _json_response(_dump_json({"tasks": tasks, "count": len(tasks), "next_cursor": next_cursor}))
+    except HTTPException:
+        raise
     except Exception as e:
-        logging.error("Error listing tasks user_id=%s: %s", user_id, e)
+        logger.error("Error listing tasks user_id=%s: %s", user_id, e)
         raise HTTPException(status_code=500, detail="Error listing tasks")
 
 
@@ -510,22 +704,12 @@ async def upload_document(payload: UploadDocumentPayload, current_user_id: Optio
     if not payload.user_id:
         raise HTTPException(status_code=400, detail="Missing user_id")
     try:
-        doc_id = str(uuid.uuid4())
-        query = """
-            INSERT INTO documents (id,user_id,course_id,file_name,file_path,file_size,file_type,document_type,description)
-            VALUES ($1,$2,$3,$4,$5,$6,$7,$8,$9)
-            RETURNING id,user_id,course_id,file_name,file_path,file_size,file_type,document_type,description,upload_date,created_at,updated_at
-        """
-        row = await db_pool.fetchrow(query, doc_id, payload.user_id, payload.course_id, payload.file_name, payload.file_path, payload.file_size, 'application/pdf', payload.document_type, payload.description)
-        document = Document(
-            id=row['id'], user_id=row['user_id'], course_id=row.get('course_id'), file_name=row['file_name'], file_path=row['file_path'],
-            file_size=row.get('file_size'), file_type=row.get('file_type'), document_type=row.get('document_type'), description=row.get('description'),
-            upload_date=row.get('upload_date'), created_at=row.get('created_at'), updated_at=row.get('updated_at')
-        )
+        row = await db_pool.fetchrow(_INSERT_DOCUMENT, payload.user_id, payload.course_id, payload.file_name, payload.file_path, payload.file_size, 'application/pdf', payload.document_type, payload.description)
         # If syllabus, optionally trigger extraction (future enhancement)
-        return DocumentResponse(document=document)
+        # RETURNING lists exactly the Document fields
+        return _json_response(_dump_json({"document": dict(row)}))
     except Exception as e:
-        logging.error("Error uploading document user_id=%s file_name=%s: %s", payload.user_id, payload.file_name, e)
+        logger.error("Error uploading document user_id=%s file_name=%s: %s", payload.user_id, payload.file_name, e)
         raise HTTPException(status_code=500, detail="Error uploading document")
 
 # CORS middleware
@@ -541,7 +725,42 @@ app.add_middleware(
 @app.get("/")
 async def root():
     """Root endpoint"""
-    return {"message": "StudyFlow API is running", "version": "1.0.0"}
+    return _json_response(_dump_json({"message": "StudyFlow API is running", "version": "1.0.0"}))
+
+
+def _stored_timestamp(value):
+    """Return `value` the way a timestamptz column hands it back: in UTC.
+
+    Mirrors asyncpg's encoder, which writes `value.astimezone(utc)`, so a
+    naive datetime is read as the API host's local time, not as UTC."""
+    if not isinstance(value, datetime):
+        return value
+    return value.astimezone(timezone.utc)
+
+
+async def _insert_tasks(tasks: List[Task]) -> List[dict]:
+    """Insert tasks with a single COPY.
+
+    Returns the inserted tasks as Task dicts (with their generated ids and
+    timestamps) in the same order as `tasks`. COPY writes every column
+    except the created_at/updated_at defaults, so the rows are completed
+    here instead of being read back.
+    """
+    task_ids = await db_pool.bulk_insert_tasks(tasks)
+    now = datetime.now(timezone.utc)
+    return [
+        {
+            **task.__dict__, 'id': task_id, 'due_date': _stored_timestamp(task.due_date),
+            'created_at': now, 'updated_at': now,
+        }
+        for task_id, task in zip(task_ids, tasks)
+    ]
+
+
+# icalendar and recurring_ical_events need the whole calendar in memory
+# (VTIMEZONEs and RECURRENCE-ID overrides refer across components), so the
+# size of what we are willing to parse is bounded instead
+ICS_MAX_BYTES = 10 * 1024 * 1024
 
 
 @app.post("/v1/import-ics", response_model=ExtractDeadlinesResponse)
@@ -553,13 +772,16 @@ async def import_ics(file: UploadFile = File(...), current_user_id: Optional[str
     if not current_user_id:
         raise HTTPException(status_code=401, detail="Authentication required")
     user_id = current_user_id
-    logging.info(f"Import ICS for user {user_id}, filename: {file.filename}")
+    logger.info("Import ICS for user %s, filename: %s", user_id, file.filename)
     try:
+        if file.size is not None and file.size > ICS_MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"ICS file too large (max {ICS_MAX_BYTES} bytes)")
         content = await file.read()
-        logging.info(f"Read {len(content)} bytes from file")
-        cal = Calendar.from_ical(content)
-        logging.info(f"Parsed calendar successfully")
-        inserted_tasks = []
+        logger.info("Read %d bytes from file", len(content))
+        # Parsing is pure Python and scales with the file; keep it off the event loop
+        cal = await asyncio.to_thread(Calendar.from_ical, content)
+        logger.info("Parsed calendar successfully")
+        tasks = []
 
         for component in cal.walk():
             try:
@@ -586,38 +808,73 @@ async def import_ics(file: UploadFile = File(...), current_user_id: Optional[str
                     except Exception:
                         due_dt = None
 
-                task_id = str(uuid.uuid4())
-                query = """
-                    INSERT INTO tasks (
-                        id, user_id, title, "type", priority, status, due_date
-                    ) VALUES ($1, $2, $3, $4, $5, $6, $7)
-                    RETURNING id, user_id, title, "type", priority, status, due_date, estimated_duration, created_at, updated_at
-                """
-                row = await db_pool.fetchrow(
-                    query,
-                    task_id,
-                    user_id,
-                    str(summary),
-                    'other',  # Use 'other' instead of 'calendar' - it's an accepted value
-                    'low',
-                    'todo',
-                    due_dt
-                )
-                if row:
-                    inserted_tasks.append(Task(
-                        id=row['id'], user_id=row['user_id'], title=row['title'],
-                        description=None, type=row.get('type') if row.get('type') is not None else row.get('task_type'),
-                        priority=row.get('priority'), status=row.get('status'),
-                        due_date=row.get('due_date'), estimated_duration=row.get('estimated_duration'),
-                        created_at=row.get('created_at'), updated_at=row.get('updated_at')
-                    ))
+                tasks.append(Task.model_construct(
+                    user_id=user_id,
+                    title=str(summary),
+                    type='other',  # Use 'other' instead of 'calendar' - it's an accepted value
+                    priority='low',
+                    status='todo',
+                    due_date=due_dt,
+                ))
             except Exception as inner:
-                logging.warning("Skipping calendar component due to error: %s", inner)
+                logger.warning("Skipping calendar component due to error: %s", inner)
 
-        return ExtractDeadlinesResponse(tasks=inserted_tasks, count=len(inserted_tasks))
+        # All components go in with one COPY instead of one INSERT each
+        inserted_tasks = await _insert_tasks(tasks)
+        _invalidate_user_views(user_id)
+        return _json_response(_dump_json({"tasks": inserted_tasks, "count": len(inserted_tasks)}))
+    except HTTPException:
+        raise
     except Exception as e:
-        logging.error(f"Error in import_ics: {str(e)}", exc_info=True)
+        logger.error("Error in import_ics: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error importing ICS: {str(e)}")
+
+
+# Limits for a single uploaded PDF: a few pathological (huge, graphics-heavy or
+# corrupted) documents would otherwise tie up a worker for minutes
+PDF_MAX_PAGES = 500
+PDF_BUDGET_SECONDS = 10
+
+# PDFium is not thread-safe at all: no two threads of the process may call
+# into it at once, even on separate documents. Concurrent uploads still run
+# `_extract_text` on executor threads, so every PDFium call happens under
+# this lock (parallel extraction would need worker processes).
+_pdfium_lock = threading.Lock()
+
+
+def _extract_text(pdf_source: Union[bytes, BinaryIO]) -> str:
+    """Return the text of every page of a PDF, one page per line block.
+
+    `pdf_source` may be raw bytes or a seekable binary file object; pdfium
+    reads file objects page by page instead of needing the whole document.
+    Documents over PDF_MAX_PAGES are rejected; once PDF_BUDGET_SECONDS have
+    passed, the text of the pages read so far is returned.
+    """
+    with _pdfium_lock:
+        pdf = pdfium.PdfDocument(pdf_source)
+        try:
+            page_count = len(pdf)
+            logger.info("PDF has %d pages", page_count)
+            if page_count > PDF_MAX_PAGES:
+                raise HTTPException(status_code=413, detail=f"PDF has too many pages (max {PDF_MAX_PAGES})")
+            deadline = monotonic() + PDF_BUDGET_SECONDS
+            # Pages are read serially; each page's native handles are freed
+            # before the next one is loaded.
+            pages_text = []
+            for page in pdf:
+                textpage = page.get_textpage()
+                pages_text.append(textpage.get_text_range())
+                textpage.close()
+                page.close()
+                if monotonic() >= deadline and len(pages_text) < page_count:
+                    logger.warning("PDF text extraction over budget; stopping after %d of %d pages", len(pages_text), page_count)
+                    break
+            return "\n".join(pages_text)
+        finally:
+            # Release the native document handle right away
+            pdf.close()
+
+
 @app.post("/v1/extract-deadlines", response_model=ExtractDeadlinesResponse)
 async def extract_deadlines(file: UploadFile = File(...), current_user_id: Optional[str] = Depends(get_current_user_id)):
     """
@@ -633,71 +890,33 @@ async def extract_deadlines(file: UploadFile = File(...), current_user_id: Optio
     if not current_user_id:
         raise HTTPException(status_code=401, detail="Authentication required")
     user_id = current_user_id
-    logging.info(f"Extract deadlines for user {user_id}, filename: {file.filename}")
+    logger.info("Extract deadlines for user %s, filename: %s", user_id, file.filename)
     try:
-        # Read PDF content
-        pdf_content = await file.read()
-        logging.info(f"Read {len(pdf_content)} bytes from PDF")
-        pdf_file = io.BytesIO(pdf_content)
+        # The upload is already spooled to a temporary file (on disk past 1 MB);
+        # hand that file to the parser instead of copying it into memory
+        await file.seek(0)
+        logger.info("Received %s bytes of PDF", file.size)
         
-        # Extract text from PDF
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        logging.info(f"PDF has {len(pdf_reader.pages)} pages")
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text()
+        # Extract text from PDF off the event loop; parsing is CPU-bound and
+        # serialized process-wide by _pdfium_lock
+        text = await asyncio.get_running_loop().run_in_executor(None, _extract_text, file.file)
         
-        logging.info(f"Extracted {len(text)} characters from PDF")
+        logger.info("Extracted %d characters from PDF", len(text))
         
         # Parse tasks from text using LLM (with fallback to regex)
         tasks = await extract_tasks_with_llm(text, user_id=user_id)
-        logging.info(f"Parsed {len(tasks)} tasks from text using LLM")
+        logger.info("Parsed %d tasks from text using LLM", len(tasks))
         
-        # Insert tasks into database
-        inserted_tasks = []
-        for task in tasks:
-            task_id = str(uuid.uuid4())
-            
-            query = """
-                INSERT INTO tasks (
-                    id, user_id, title, "type", priority, status,
-                    due_date, estimated_duration
-                ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
-                RETURNING id, user_id, title, "type", priority, status,
-                          due_date, estimated_duration, created_at, updated_at
-            """
-            
-            result = await db_pool.fetchrow(
-                query,
-                task_id,
-                task.user_id,
-                task.title,
-                task.type,
-                task.priority,
-                task.status,
-                task.due_date,
-                task.estimated_duration
-            )
-            
-            if result:
-                inserted_task = Task(
-                    id=str(result['id']),
-                    user_id=result['user_id'],
-                    title=result['title'],
-                    description=result.get('description'),
-                    type=result['type'] if 'type' in result else result.get('task_type'),
-                    priority=result['priority'],
-                    status=result['status'],
-                    due_date=result['due_date'],
-                    estimated_duration=result['estimated_duration'] if 'estimated_duration' in result else result.get('estimated_minutes'),
-                )
-                inserted_tasks.append(inserted_task)
+        inserted_tasks = await _insert_tasks(tasks)
         
-        logging.info(f"Successfully inserted {len(inserted_tasks)} tasks from PDF")
-        return ExtractDeadlinesResponse(tasks=inserted_tasks, count=len(inserted_tasks))
+        logger.info("Successfully inserted %d tasks from PDF", len(inserted_tasks))
+        _invalidate_user_views(user_id)
+        return _json_response(_dump_json({"tasks": inserted_tasks, "count": len(inserted_tasks)}))
     
+    except HTTPException:
+        raise
     except Exception as e:
-        logging.error(f"Error in extract_deadlines: {str(e)}", exc_info=True)
+        logger.error("Error in extract_deadlines: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error extracting deadlines: {str(e)}")
 
 
@@ -713,54 +932,26 @@ async def plan_week(plan_request: PlanRequest):
         PlanWeekResponse with generated time blocks
     """
     try:
-        # Generate time blocks using planning algorithm
-        time_blocks = generate_plan(plan_request)
+        # Generate time blocks using planning algorithm; large task lists make
+        # this CPU-bound, so it runs off the event loop
+        time_blocks = await asyncio.to_thread(generate_plan, plan_request)
         
-        # Insert time blocks into database
-        inserted_blocks = []
-        for block in time_blocks:
-            block_id = str(uuid.uuid4())
-            
-            query = """
-                INSERT INTO time_blocks (
-                    id, user_id, task_id, title, description,
-                    start_time, end_time, block_type, is_completed
-                ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
-                RETURNING id, user_id, task_id, title, description,
-                          start_time, end_time, block_type, is_completed,
-                          created_at, updated_at
-            """
-            
-            result = await db_pool.fetchrow(
-                query,
-                block_id,
-                block.user_id,
-                block.task_id,
-                block.title,
-                block.description,
-                block.start_time,
-                block.end_time,
-                block.block_type,
-                block.is_completed
-            )
-            
-            if result:
-                inserted_block = TimeBlock(
-                    id=str(result['id']),
-                    user_id=result['user_id'],
-                    task_id=str(result['task_id']) if result['task_id'] else None,
-                    title=result['title'],
-                    description=result['description'],
-                    start_time=result['start_time'],
-                    end_time=result['end_time'],
-                    block_type=result['block_type'],
-                    is_completed=result['is_completed'],
-                    created_at=result['created_at'],
-                    updated_at=result['updated_at']
-                )
-                inserted_blocks.append(inserted_block)
+        # Insert time blocks into database in a single COPY; it writes every
+        # column but the timestamp defaults, so nothing needs reading back
+        block_ids = await db_pool.bulk_insert_time_blocks(time_blocks)
+        now = datetime.now(timezone.utc)
+        inserted_blocks = [
+            {
+                **block.__dict__, 'id': block_id,
+                'start_time': _stored_timestamp(block.start_time),
+                'end_time': _stored_timestamp(block.end_time),
+                'created_at': now, 'updated_at': now,
+            }
+            for block_id, block in zip(block_ids, time_blocks)
+        ]
         
-        return PlanWeekResponse(time_blocks=inserted_blocks, count=len(inserted_blocks))
+        _invalidate_user_views(plan_request.user_id)
+        return _json_response(_dump_json({"time_blocks": inserted_blocks, "count": len(inserted_blocks)}))
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error planning week: {str(e)}")
@@ -780,83 +971,43 @@ async def get_tasks_today(current_user_id: Optional[str] = Depends(get_current_u
     if not current_user_id:
         raise HTTPException(status_code=401, detail="Authentication required")
     user_id = current_user_id
+    cached = _get_cached_view(_today_cache, user_id)
+    if cached is not None:
+        return _json_response(cached)
     try:
-        # Get today's date range
-        today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        today_end = today_start + timedelta(days=1)
-        
-        # Query time blocks for today
-        blocks_query = """
-            SELECT id, user_id, task_id, title, description,
-                   start_time, end_time, block_type, is_completed,
-                   created_at, updated_at
-            FROM time_blocks
-            WHERE user_id = $1
-              AND start_time >= $2
-              AND start_time < $3
-            ORDER BY start_time ASC
-        """
-        
-        blocks_result = await db_pool.fetch(blocks_query, user_id, today_start, today_end)
+        # Query time blocks for today (bounds computed in SQL from the user's
+        # timezone) together with the tasks they reference
+        rows = await db_pool.fetch(_TODAY_BLOCKS_WITH_TASKS, user_id)
         
         time_blocks = []
-        task_ids = set()
+        tasks = []
+        seen = set()
         
-        for row in blocks_result:
-            time_block = TimeBlock(
-                id=str(row['id']),
-                user_id=row['user_id'],
-                task_id=str(row['task_id']) if row['task_id'] else None,
-                title=row['title'],
-                description=row['description'],
-                start_time=row['start_time'],
-                end_time=row['end_time'],
-                block_type=row['block_type'],
-                is_completed=row['is_completed'],
-                created_at=row['created_at'],
-                updated_at=row['updated_at']
-            )
-            time_blocks.append(time_block)
+        # Read-only path: rows go straight to dicts and orjson; the response
+        # model is only used for the OpenAPI schema
+        for row in rows:
+            time_blocks.append(_time_block_dict(row, prefix="tb_"))
             
-            if row['task_id']:
-                task_ids.add(str(row['task_id']))
+            # A task may be scheduled in several blocks; list it once
+            if row['t_id'] is None or row['t_id'] in seen:
+                continue
+            seen.add(row['t_id'])
+            tasks.append(_task_dict(row, prefix="t_"))
         
-        # Query tasks for these time blocks
-        tasks = []
-        if task_ids:
-            tasks_query = """
-                SELECT id, user_id, title, description,
-                       "type", priority, status, due_date,
-                       estimated_duration
-                FROM tasks
-                WHERE id = ANY($1::uuid[])
-                ORDER BY priority DESC, due_date ASC
-            """
-            
-            tasks_result = await db_pool.fetch(tasks_query, list(task_ids))
-            
-            for row in tasks_result:
-                task = Task(
-                    id=row['id'],
-                    user_id=row['user_id'],
-                    title=row['title'],
-                    description=row.get('description'),
-                    type=row.get('type') if row.get('type') is not None else row.get('task_type'),
-                    priority=row.get('priority'),
-                    status=row.get('status'),
-                    due_date=row.get('due_date'),
-                    estimated_duration=row.get('estimated_duration') if row.get('estimated_duration') is not None else row.get('estimated_minutes'),
-                )
-                tasks.append(task)
+        # Same ordering the tasks query used: priority DESC, due_date ASC (NULLs last)
+        tasks.sort(key=lambda t: (t['due_date'] is None, t['due_date'] or datetime.min))
+        tasks.sort(key=lambda t: t['priority'] or "", reverse=True)
         
-        return TodayTasksResponse(
-            tasks=tasks,
-            time_blocks=time_blocks,
-            count=len(time_blocks)
-        )
+        body = _dump_json({
+            "tasks": tasks,
+            "time_blocks": time_blocks,
+            "count": len(time_blocks),
+        })
+        _cache_view(_today_cache, user_id, body)
+        return _json_response(body)
     
     except Exception as e:
-        logging.error("Error in /v1/tasks/today for user_id=%s: %s\n%s", user_id, e, traceback.format_exc())
+        logger.error("Error in /v1/tasks/today for user_id=%s: %s", user_id, e, exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error fetching today's tasks: {str(e)}")
 
 
@@ -875,114 +1026,85 @@ async def get_next_action(current_user_id: Optional[str] = Depends(get_current_u
     if not current_user_id:
         raise HTTPException(status_code=401, detail="Authentication required")
     user_id = current_user_id
+    cached = _get_cached_view(_next_action_cache, user_id)
+    if cached is not None:
+        return _json_response(cached)
     try:
-        now = datetime.now()
-        
-        # First, check if there's a current time block
-        current_block_query = """
-            SELECT id, user_id, task_id, title, description,
-                   start_time, end_time, block_type, is_completed,
-                   created_at, updated_at
-            FROM time_blocks
-            WHERE user_id = $1
-              AND start_time <= $2
-              AND end_time > $2
-              AND is_completed = false
-            ORDER BY start_time ASC
-            LIMIT 1
-        """
+        # Current time block (and its task), else the highest priority open task
+        row = await db_pool.fetchrow(_NEXT_ACTION, user_id)
         
-        current_block = await db_pool.fetchrow(current_block_query, user_id, now)
+        time_block = None
+        task = None
+        if row is not None:
+            if row['tb_id'] is not None:
+                time_block = _time_block_dict(row, prefix="tb_")
+            # A block may have no task; no row at all means no open tasks
+            if row['t_id'] is not None:
+                task = _task_dict(row, prefix="t_")
         
-        if current_block:
-            time_block = TimeBlock(
-                id=str(current_block['id']),
-                user_id=current_block['user_id'],
-                task_id=str(current_block['task_id']) if current_block['task_id'] else None,
-                title=current_block['title'],
-                description=current_block['description'],
-                start_time=current_block['start_time'],
-                end_time=current_block['end_time'],
-                block_type=current_block['block_type'],
-                is_completed=current_block['is_completed'],
-                created_at=current_block['created_at'],
-                updated_at=current_block['updated_at']
-            )
-            
-            # Get associated task if exists
-            task = None
-            if current_block['task_id']:
-                task_query = """
-                    SELECT id, user_id, course_id, title, description,
-                           "type", priority, status, due_date,
-                           estimated_duration
-                    FROM tasks
-                    WHERE id = $1
-                """
-                task_row = await db_pool.fetchrow(task_query, current_block['task_id'])
-                
-                if task_row:
-                    task = Task(
-                        id=str(task_row['id']),
-                        user_id=task_row['user_id'],
-                        title=task_row['title'],
-                        description=task_row.get('description'),
-                        type=task_row.get('type') if task_row.get('type') is not None else task_row.get('task_type'),
-                        priority=task_row.get('priority'),
-                        status=task_row.get('status'),
-                        due_date=task_row.get('due_date'),
-                        estimated_duration=task_row.get('estimated_duration') if task_row.get('estimated_duration') is not None else task_row.get('estimated_minutes'),
-                    )
-            
-            return NextActionResponse(task=task, time_block=time_block)
-        
-        # If no current block, find the highest priority incomplete task
-        priority_task_query = """
-            SELECT id, user_id, course_id, title, description,
-                   "type", priority, status, due_date,
-                   estimated_duration
-            FROM tasks
-            WHERE user_id = $1
-              AND status != 'completed'
-              AND status != 'cancelled'
-            ORDER BY
-                CASE priority
-                    WHEN 'urgent' THEN 4
-                    WHEN 'high' THEN 3
-                    WHEN 'medium' THEN 2
-                    WHEN 'low' THEN 1
-                END DESC,
-                due_date ASC NULLS LAST
-            LIMIT 1
-        """
-        
-        task_row = await db_pool.fetchrow(priority_task_query, user_id)
-        
-        if task_row:
-            task = Task(
-                id=str(task_row['id']),
-                user_id=task_row['user_id'],
-                title=task_row['title'],
-                description=task_row.get('description'),
-                type=task_row.get('type') if task_row.get('type') is not None else task_row.get('task_type'),
-                priority=task_row.get('priority'),
-                status=task_row.get('status'),
-                due_date=task_row.get('due_date'),
-                estimated_duration=task_row.get('estimated_duration') if task_row.get('estimated_duration') is not None else task_row.get('estimated_minutes'),
-            )
-            
-            return NextActionResponse(task=task, time_block=None)
-        
-        # No tasks found
-        return NextActionResponse(task=None, time_block=None)
+        body = _dump_json({"task": task, "time_block": time_block})
+        _cache_view(_next_action_cache, user_id, body)
+        return _json_response(body)
     
     except Exception as e:
-        logging.error("Error in /v1/next-action for user_id=%s: %s\n%s", user_id, e, traceback.format_exc())
+        logger.error("Error in /v1/next-action for user_id=%s: %s", user_id, e, exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error fetching next action: {str(e)}")
 
 
 # ========== PHASE 2: INTELLIGENCE & IMPORTS ==========
 
+_UPSERT_MOODLE_COURSES = """
+    INSERT INTO courses (user_id, name, code)
+    SELECT $1::uuid, c.name, c.code
+    FROM unnest($2::text[], $3::text[]) AS c(name, code)
+    ON CONFLICT (user_id, code) DO UPDATE SET name = EXCLUDED.name
+    RETURNING id, code
+"""
+
+# Assignments are matched to existing tasks by (user, title, course): matches
+# get the new due date, the rest are inserted. Both CTEs read the same
+# snapshot, so a row is either updated or inserted, never both.
+_SYNC_MOODLE_ASSIGNMENTS = """
+    WITH input AS (
+        SELECT *
+        FROM unnest($2::text[], $3::uuid[], $4::timestamptz[]) AS i(title, course_id, due_date)
+    ), updated AS (
+        UPDATE tasks t
+        SET due_date = i.due_date, updated_at = NOW()
+        FROM input i
+        WHERE t.user_id = $1::uuid AND t.title = i.title AND t.course_id = i.course_id
+        RETURNING t.title, t.course_id
+    ), created AS (
+        INSERT INTO tasks (user_id, course_id, title, type, priority, status, due_date, estimated_duration)
+        SELECT $1::uuid, i.course_id, i.title, 'homework', 'medium', 'todo', i.due_date, 120
+        FROM input i
+        WHERE NOT EXISTS (
+            SELECT 1 FROM tasks t
+            WHERE t.user_id = $1::uuid AND t.title = i.title AND t.course_id = i.course_id
+        )
+        RETURNING 1
+    )
+    SELECT (SELECT count(DISTINCT (title, course_id)) FROM updated) AS updated,
+           (SELECT count(*) FROM created) AS created
+"""
+
+_SELECT_COURSE_IDS_BY_CODE = "SELECT id, code FROM courses WHERE user_id = $1"
+
+# Quiz/exam events become tasks unless the user already has a task with that title
+_SYNC_MOODLE_EVENTS = """
+    WITH created AS (
+        INSERT INTO tasks (user_id, course_id, title, type, priority, status, due_date, estimated_duration)
+        SELECT $1::uuid, i.course_id, i.title, i.type, 'urgent', 'todo', i.due_date, 180
+        FROM unnest($2::text[], $3::uuid[], $4::text[], $5::timestamptz[]) AS i(title, course_id, type, due_date)
+        WHERE NOT EXISTS (
+            SELECT 1 FROM tasks t WHERE t.user_id = $1::uuid AND t.title = i.title
+        )
+        RETURNING 1
+    )
+    SELECT count(*) FROM created
+"""
+
+
 @app.post("/v1/moodle/sync", response_model=SyncResponse)
 async def sync_moodle(payload: MoodleSyncRequest, current_user_id: Optional[str] = Depends(get_current_user_id)):
     """
@@ -999,27 +1121,39 @@ async def sync_moodle(payload: MoodleSyncRequest, current_user_id: Optional[str]
         # Prepare Moodle API request
         moodle_url = payload.moodle_url.rstrip('/')
         
-        logging.info(f"Moodle sync started for user {current_user_id}, URL: {moodle_url}")
+        logger.info("Moodle sync started for user %s, URL: %s", current_user_id, moodle_url)
         
-        # 1. Get assignments
-        assignments_endpoint = f"{moodle_url}/webservice/rest/server.php"
+        rest_endpoint = f"{moodle_url}/webservice/rest/server.php"
         assignments_params = {
             'wstoken': payload.token,
             'wsfunction': 'mod_assign_get_assignments',
             'moodlewsrestformat': 'json'
         }
+        events_params = {
+            'wstoken': payload.token,
+            'wsfunction': 'core_calendar_get_calendar_events',
+            'moodlewsrestformat': 'json'
+        }
         
-        logging.info(f"Calling Moodle assignments API: {assignments_endpoint}")
-        assignments_response = requests.get(assignments_endpoint, params=assignments_params, timeout=10)
+        # The two web service calls are independent; issue them together
+        logger.info("Calling Moodle assignments and calendar APIs: %s", rest_endpoint)
+        assignments_response, events_response = await asyncio.gather(
+            _sync_client.get(rest_endpoint, params=assignments_params),
+            _sync_client.get(rest_endpoint, params=events_params),
+        )
         assignments_response.raise_for_status()
-        assignments_data = assignments_response.json()
+        events_response.raise_for_status()
+        
+        # 1. Assignments
+        assignments_data = orjson.loads(assignments_response.content)
         
-        logging.info(f"Moodle API response: {assignments_data}")
+        # Full payload can be large; only formatted when debug logging is on
+        logger.debug("Moodle API response: %s", assignments_data)
         
         # Check for error in response
         if 'exception' in assignments_data or 'errorcode' in assignments_data:
             error_msg = assignments_data.get('message', assignments_data.get('errorcode', 'Unknown Moodle error'))
-            logging.error(f"Moodle API error: {error_msg}")
+            logger.error("Moodle API error: %s", error_msg)
             raise HTTPException(
                 status_code=400, 
                 detail=f"Moodle error: {error_msg}. Vérifiez que les webservices sont activés et que vous utilisez un token webservice (pas un token de sécurité)."
@@ -1027,22 +1161,23 @@ async def sync_moodle(payload: MoodleSyncRequest, current_user_id: Optional[str]
         
         # Parse assignments
         if 'courses' in assignments_data:
-            for course in assignments_data['courses']:
-                course_name = course.get('shortname', 'Unknown Course')
-                
-                # Get or create course
-                course_query = """
-                    INSERT INTO courses (id, user_id, name, code)
-                    VALUES ($1, $2, $3, $4)
-                    ON CONFLICT (user_id, code) DO UPDATE SET name = EXCLUDED.name
-                    RETURNING id
-                """
-                course_id = str(uuid.uuid4())
-                course_code = course.get('shortname', 'UNKNOWN')
-                course_row = await db_pool.fetchrow(course_query, course_id, current_user_id, course_name, course_code)
-                course_id = str(course_row['id'])
-                
-                # Process assignments
+            courses = assignments_data['courses']
+            
+            # Get or create every course in one statement (code -> name; a
+            # code may appear only once per ON CONFLICT batch)
+            course_names = {
+                course.get('shortname', 'UNKNOWN'): course.get('shortname', 'Unknown Course')
+                for course in courses
+            }
+            course_rows = await db_pool.fetch(
+                _UPSERT_MOODLE_COURSES, current_user_id, list(course_names.values()), list(course_names)
+            )
+            course_ids = {row['code']: row['id'] for row in course_rows}
+            
+            # (title, course_id) -> due_date; a repeated assignment keeps its last due date
+            assignments = {}
+            for course in courses:
+                course_id = course_ids[course.get('shortname', 'UNKNOWN')]
                 for assignment in course.get('assignments', []):
                     title = assignment.get('name', 'Untitled Assignment')
                     due_timestamp = assignment.get('duedate', 0)
@@ -1051,44 +1186,32 @@ async def sync_moodle(payload: MoodleSyncRequest, current_user_id: Optional[str]
                         due_date = datetime.fromtimestamp(due_timestamp)
                     else:
                         due_date = None
-                    
-                    # Check if task already exists (by title and course)
-                    existing_task = await db_pool.fetchrow(
-                        "SELECT id FROM tasks WHERE user_id=$1 AND title=$2 AND course_id=$3",
-                        current_user_id, title, course_id
-                    )
-                    
-                    if existing_task:
-                        # Update existing task
-                        await db_pool.execute(
-                            """UPDATE tasks SET due_date=$1, updated_at=NOW() 
-                               WHERE id=$2""",
-                            due_date, str(existing_task['id'])
-                        )
-                        tasks_updated += 1
-                    else:
-                        # Create new task
-                        task_id = str(uuid.uuid4())
-                        await db_pool.execute(
-                            """INSERT INTO tasks (id, user_id, course_id, title, type, priority, status, due_date, estimated_duration)
-                               VALUES ($1,$2,$3,$4,$5,$6,$7,$8,$9)""",
-                            task_id, current_user_id, course_id, title, 'homework', 'medium', 'todo', due_date, 120
-                        )
-                        tasks_created += 1
-        
-        # 2. Get calendar events
-        events_params = {
-            'wstoken': payload.token,
-            'wsfunction': 'core_calendar_get_calendar_events',
-            'moodlewsrestformat': 'json'
-        }
+                    assignments[(title, course_id)] = due_date
+            
+            # Update the ones that already exist and create the rest, in one round-trip
+            if assignments:
+                counts = await db_pool.fetchrow(
+                    _SYNC_MOODLE_ASSIGNMENTS,
+                    current_user_id,
+                    [title for title, _ in assignments],
+                    [course_id for _, course_id in assignments],
+                    list(assignments.values()),
+                )
+                tasks_updated += counts['updated']
+                tasks_created += counts['created']
         
-        events_response = requests.get(assignments_endpoint, params=events_params, timeout=10)
-        events_response.raise_for_status()
-        events_data = events_response.json()
+        # 2. Calendar events
+        events_data = orjson.loads(events_response.content)
         
         # Parse events (exams, quizzes)
         if 'events' in events_data:
+            # All of the user's courses by code, fetched once (this includes
+            # the ones just upserted from the assignments)
+            course_rows = await db_pool.fetch(_SELECT_COURSE_IDS_BY_CODE, current_user_id)
+            courses_by_code = {row['code']: row['id'] for row in course_rows}
+            
+            # title -> (course_id, type, due_date); the first event with a title wins
+            event_tasks = {}
             for event in events_data['events']:
                 event_name = event.get('name', 'Event')
                 event_type = event.get('modulename', 'event')
@@ -1099,46 +1222,151 @@ async def sync_moodle(payload: MoodleSyncRequest, current_user_id: Optional[str]
                     due_date = datetime.fromtimestamp(due_timestamp) if due_timestamp > 0 else None
                     
                     # Get course
-                    course_id = None
                     course_name = event.get('course', {}).get('shortname') if isinstance(event.get('course'), dict) else None
-                    if course_name:
-                        course_query = "SELECT id FROM courses WHERE user_id=$1 AND code=$2"
-                        course_row = await db_pool.fetchrow(course_query, current_user_id, course_name)
-                        if course_row:
-                            course_id = str(course_row['id'])
+                    course_id = courses_by_code.get(course_name) if course_name else None
                     
-                    # Check if task exists
-                    existing_task = await db_pool.fetchrow(
-                        "SELECT id FROM tasks WHERE user_id=$1 AND title=$2",
-                        current_user_id, event_name
-                    )
-                    
-                    if not existing_task:
-                        task_id = str(uuid.uuid4())
-                        task_type = 'exam' if event_type == 'quiz' else 'quiz'
-                        await db_pool.execute(
-                            """INSERT INTO tasks (id, user_id, course_id, title, type, priority, status, due_date, estimated_duration)
-                               VALUES ($1,$2,$3,$4,$5,$6,$7,$8,$9)""",
-                            task_id, current_user_id, course_id, event_name, task_type, 'urgent', 'todo', due_date, 180
-                        )
-                        tasks_created += 1
+                    task_type = 'exam' if event_type == 'quiz' else 'quiz'
+                    event_tasks.setdefault(event_name, (course_id, task_type, due_date))
+            
+            # Create the tasks whose title the user does not have yet, in one round-trip
+            if event_tasks:
+                tasks_created += await db_pool.fetchval(
+                    _SYNC_MOODLE_EVENTS,
+                    current_user_id,
+                    list(event_tasks),
+                    [course_id for course_id, _, _ in event_tasks.values()],
+                    [task_type for _, task_type, _ in event_tasks.values()],
+                    [due_date for _, _, due_date in event_tasks.values()],
+                )
         
-        return SyncResponse(
-            success=True,
-            tasks_created=tasks_created,
-            tasks_updated=tasks_updated,
-            time_blocks_created=0,
-            message=f"Moodle sync complete: {tasks_created} created, {tasks_updated} updated"
-        )
+        _invalidate_user_views(current_user_id)
+        return _json_response(_dump_json({
+            "success": True,
+            "tasks_created": tasks_created,
+            "tasks_updated": tasks_updated,
+            "time_blocks_created": 0,
+            "message": f"Moodle sync complete: {tasks_created} created, {tasks_updated} updated",
+        }))
     
-    except requests.RequestException as e:
-        logging.error(f"Moodle API error: {e}")
+    except httpx.HTTPError as e:
+        logger.error("Moodle API error: %s", e)
         raise HTTPException(status_code=502, detail=f"Moodle API error: {str(e)}")
     except Exception as e:
-        logging.error(f"Moodle sync error: {e}")
+        logger.error("Moodle sync error: %s", e)
         raise HTTPException(status_code=500, detail=f"Sync error: {str(e)}")
 
 
+def _ics_date(value) -> Optional[date]:
+    """Calendar date of an iCalendar date/datetime property value (None if absent)."""
+    dt = getattr(value, 'dt', None)
+    if isinstance(dt, datetime):
+        return dt.date()
+    return dt if isinstance(dt, date) else None
+
+
+# Days spanned by one period of a COUNT-limited rule the pre-filter can bound
+_RRULE_PERIOD_DAYS = {'DAILY': 1, 'WEEKLY': 7}
+
+
+def _rrule_count_bound(rrule, first: date) -> Optional[date]:
+    """Latest possible date of a COUNT-limited DAILY/WEEKLY rule, or None.
+
+    Only plain DAILY rules and WEEKLY rules with at most a BYDAY part are
+    bounded: every period then yields at least one occurrence (after the
+    first week), so COUNT occurrences fit in COUNT + 1 periods.
+    """
+    count = rrule.get('COUNT')
+    freq = rrule.get('FREQ')
+    if not count or not freq or freq[0] not in _RRULE_PERIOD_DAYS:
+        return None
+    allowed = {'FREQ', 'COUNT', 'INTERVAL', 'WKST'}
+    if freq[0] == 'WEEKLY':
+        allowed.add('BYDAY')
+    if not set(rrule) <= allowed:
+        return None
+    interval = int(rrule.get('INTERVAL', [1])[0])
+    periods = int(count[0]) + 1
+    return first + timedelta(days=periods * interval * _RRULE_PERIOD_DAYS[freq[0]])
+
+
+def _may_occur_between(component, start: datetime, end: datetime) -> bool:
+    """Cheap pre-filter for `sync_ics`: False only for a VEVENT that certainly
+    has no occurrence in [start, end).
+
+    Compares calendar dates with a day of slack, so timezones never matter.
+    Anything else (VTIMEZONE, RECURRENCE-ID overrides, RDATEs, open-ended or
+    unboundable rules, unparseable values) is kept for recurring_ical_events to decide.
+    """
+    if component.name != 'VEVENT' or 'RECURRENCE-ID' in component or 'RDATE' in component:
+        return True
+    try:
+        first = _ics_date(component.get('dtstart'))
+        if first is None:
+            return True
+        if first > end.date() + timedelta(days=1):
+            return False
+        # How long each occurrence lasts (DURATION, else DTEND - DTSTART),
+        # rounded up to whole days so an ongoing occurrence is never cut short
+        duration = component.get('duration')
+        if duration is not None:
+            span = duration.dt
+            if not isinstance(span, timedelta):
+                return True
+            span = timedelta(days=span.days + bool(span.seconds or span.microseconds))
+        else:
+            dtend = _ics_date(component.get('dtend'))
+            span = dtend - first if dtend else timedelta(0)
+        rrule = component.get('rrule')
+        if rrule is not None:
+            until = rrule.get('UNTIL')
+            if until:
+                last = until[0].date() if isinstance(until[0], datetime) else until[0]
+            else:
+                last = _rrule_count_bound(rrule, first)
+                if last is None:
+                    return True
+        else:
+            last = first
+        # `last` is the latest occurrence start; it runs until `last + span`
+        return last + span >= start.date() - timedelta(days=1)
+    except Exception:
+        return True
+
+
+def _ics_events_between(content: bytes, start: datetime, end: datetime) -> list:
+    """Parse an ICS feed and expand its events occurring in [start, end).
+
+    CPU-bound; `sync_ics` runs it in a worker thread.
+    """
+    import recurring_ical_events
+
+    cal = Calendar.from_ical(content)
+    # Drop events that cannot reach the window before expanding recurrences
+    cal.subcomponents = [
+        component for component in cal.subcomponents
+        if _may_occur_between(component, start, end)
+    ]
+    return recurring_ical_events.of(cal).between(start, end)
+
+
+# Time blocks are matched by (user, start_time, end_time), which
+# idx_time_blocks_user_start (migration 0003) serves
+_SYNC_ICS_BLOCKS = """
+    WITH created AS (
+        INSERT INTO time_blocks (user_id, title, type, start_time, end_time, location, description)
+        SELECT $1::uuid, i.title, 'class', i.start_time, i.end_time, i.location, i.description
+        FROM unnest($2::text[], $3::timestamptz[], $4::timestamptz[], $5::text[], $6::text[])
+             AS i(title, start_time, end_time, location, description)
+        WHERE NOT EXISTS (
+            SELECT 1 FROM time_blocks tb
+            WHERE tb.user_id = $1::uuid AND tb.start_time = i.start_time AND tb.end_time = i.end_time
+        )
+        RETURNING 1
+    )
+    SELECT count(*) FROM created
+"""
+
+
 @app.post("/v1/ics/sync", response_model=SyncResponse)
 async def sync_ics(payload: IcsSyncRequest, current_user_id: Optional[str] = Depends(get_current_user_id)):
     """
@@ -1149,25 +1377,28 @@ async def sync_ics(payload: IcsSyncRequest, current_user_id: Optional[str] = Dep
         raise HTTPException(status_code=401, detail="Authentication required")
     
     try:
-        from icalendar import Calendar
-        import recurring_ical_events
-        from datetime import datetime, timedelta
-        
         time_blocks_created = 0
         
-        # Fetch ICS file
-        response = requests.get(payload.ics_url, timeout=10)
-        response.raise_for_status()
-        
-        # Parse ICS
-        cal = Calendar.from_ical(response.content)
+        # Fetch ICS file, giving up as soon as it outgrows ICS_MAX_BYTES
+        chunks = []
+        size = 0
+        async with _sync_client.stream("GET", payload.ics_url) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes():
+                size += len(chunk)
+                if size > ICS_MAX_BYTES:
+                    raise HTTPException(status_code=413, detail=f"ICS feed too large (max {ICS_MAX_BYTES} bytes)")
+                chunks.append(chunk)
+        content = b"".join(chunks)
         
-        # Get events for next 3 months
+        # Get events for next 3 months; parsing and expansion run off the event loop
         start_date = datetime.now()
         end_date = start_date + timedelta(days=90)
+        events = await asyncio.to_thread(_ics_events_between, content, start_date, end_date)
         
-        events = recurring_ical_events.of(cal).between(start_date, end_date)
-        
+        # (start, end) -> (summary, location, description); the first event
+        # in a slot wins, as a later one would have found it already taken
+        blocks = {}
         for event in events:
             summary = str(event.get('summary', 'Class'))
             dtstart = event.get('dtstart').dt
@@ -1181,35 +1412,36 @@ async def sync_ics(payload: IcsSyncRequest, current_user_id: Optional[str] = Dep
             if not isinstance(dtend, datetime):
                 dtend = datetime.combine(dtend, datetime.min.time())
             
-            # Check if time_block already exists
-            existing_block = await db_pool.fetchrow(
-                """SELECT id FROM time_blocks 
-                   WHERE user_id=$1 AND start_time=$2 AND end_time=$3""",
-                current_user_id, dtstart, dtend
+            blocks.setdefault((dtstart, dtend), (summary, location, description))
+        
+        # Insert every slot not already in the user's schedule, in one round-trip
+        if blocks:
+            time_blocks_created = await db_pool.fetchval(
+                _SYNC_ICS_BLOCKS,
+                current_user_id,
+                [summary for summary, _, _ in blocks.values()],
+                [start for start, _ in blocks],
+                [end for _, end in blocks],
+                [location for _, location, _ in blocks.values()],
+                [description for _, _, description in blocks.values()],
             )
-            
-            if not existing_block:
-                block_id = str(uuid.uuid4())
-                await db_pool.execute(
-                    """INSERT INTO time_blocks (id, user_id, title, type, start_time, end_time, location, description)
-                       VALUES ($1,$2,$3,$4,$5,$6,$7,$8)""",
-                    block_id, current_user_id, summary, 'class', dtstart, dtend, location, description
-                )
-                time_blocks_created += 1
         
-        return SyncResponse(
-            success=True,
-            tasks_created=0,
-            tasks_updated=0,
-            time_blocks_created=time_blocks_created,
-            message=f"ICS sync complete: {time_blocks_created} classes imported"
-        )
+        _invalidate_user_views(current_user_id)
+        return _json_response(_dump_json({
+            "success": True,
+            "tasks_created": 0,
+            "tasks_updated": 0,
+            "time_blocks_created": time_blocks_created,
+            "message": f"ICS sync complete: {time_blocks_created} classes imported",
+        }))
     
-    except requests.RequestException as e:
-        logging.error(f"ICS fetch error: {e}")
+    except HTTPException:
+        raise
+    except httpx.HTTPError as e:
+        logger.error("ICS fetch error: %s", e)
         raise HTTPException(status_code=502, detail=f"ICS fetch error: {str(e)}")
     except Exception as e:
-        logging.error(f"ICS sync error: {e}")
+        logger.error("ICS sync error: %s", e)
         raise HTTPException(status_code=500, detail=f"Sync error: {str(e)}")
 
 
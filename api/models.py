@@ -1,8 +1,8 @@
 """
 Pydantic models for StudyFlow API
 """
-from pydantic import BaseModel, Field
-from typing import Optional, List
+from pydantic import BaseModel, Field, field_validator
+from typing import Literal, Optional, List
 from datetime import datetime, time
 from uuid import UUID
 
@@ -53,7 +53,7 @@ class TimeBlock(BaseModel):
     description: Optional[str] = None
     start_time: datetime
     end_time: datetime
-    block_type: str = Field(default="study", pattern="^(study|break|exam|class|other)$")
+    block_type: Literal["study", "break", "exam", "class", "other"] = "study"
     is_completed: bool = False
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
@@ -75,11 +75,23 @@ class Profile(BaseModel):
 
 class Availability(BaseModel):
     """User availability for planning"""
-    # Accept string times to work around curl/JSON issues (e.g. "09:00" or "09:00:00")
-    start_time: str
-    end_time: str
+    # Clients send "09:00" or "09:00:00"; parsed once here so planning gets times
+    start_time: time
+    end_time: time
     days: List[str] = Field(default=["monday", "tuesday", "wednesday", "thursday", "friday"])
 
+    @field_validator("start_time", "end_time", mode="before")
+    @classmethod
+    def _parse_time_str(cls, value):
+        if not isinstance(value, str):
+            return value
+        for fmt in ("%H:%M:%S", "%H:%M"):
+            try:
+                return datetime.strptime(value, fmt).time()
+            except ValueError:
+                continue
+        raise ValueError(f"Invalid time format: {value}")
+
 
 class PlanRequest(BaseModel):
     """Request model for generating a weekly plan"""
@@ -153,6 +165,13 @@ class TasksResponse(BaseModel):
     """General tasks list response"""
     tasks: List[Task]
     count: int
+    next_cursor: Optional[str] = None  # pass as `cursor` to fetch the next page
+
+
+class DeleteResponse(BaseModel):
+    """Confirmation returned by delete endpoints"""
+    deleted: bool
+    id: str
 
 
 # ============================================
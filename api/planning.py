@@ -6,19 +6,6 @@ from datetime import datetime, timedelta
 from models import Task, TimeBlock, PlanRequest, Availability
 
 
-def _parse_time_str(s: str):
-    """Parse a short time string into a time object.
-
-    Accepts 'HH:MM' and 'HH:MM:SS'. Raises ValueError if parsing fails.
-    """
-    for fmt in ("%H:%M:%S", "%H:%M"):
-        try:
-            return datetime.strptime(s, fmt).time()
-        except Exception:
-            continue
-    raise ValueError(f"Invalid time format: {s}")
-
-
 def generate_plan(plan_request: PlanRequest) -> List[TimeBlock]:
     """
     Generate a weekly plan with time blocks based on tasks and availability.
@@ -54,15 +41,21 @@ def generate_plan(plan_request: PlanRequest) -> List[TimeBlock]:
         'other': 1
     }
     
-    # Sort tasks by priority, task type, and due date
-    sorted_tasks = sorted(
-        plan_request.tasks,
-        key=lambda t: (
+    # Sort tasks by priority, task type, and due date. Keys are plain numbers
+    # (no due date sorts last); the index keeps the sort stable and means
+    # Task objects are never compared
+    decorated = [
+        (
             -priority_order.get(t.priority, 0),
             -task_type_order.get(t.type, 0),
-            t.due_date if t.due_date else datetime.max
+            t.due_date.timestamp() if t.due_date else float('inf'),
+            i,
+            t,
         )
-    )
+        for i, t in enumerate(plan_request.tasks)
+    ]
+    decorated.sort()
+    sorted_tasks = [t for *_, t in decorated]
     
     # Day mapping
     day_mapping = {
@@ -73,8 +66,28 @@ def generate_plan(plan_request: PlanRequest) -> List[TimeBlock]:
     # Start scheduling from tomorrow
     current_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
     
-    # Track daily study hours
-    daily_hours = {}
+    # Use the first availability entry (clients send a list)
+    if not plan_request.availability:
+        return time_blocks
+    avail: Availability = plan_request.availability[0]
+    allowed_days = frozenset(day_mapping[d] for d in avail.days if d in day_mapping)
+    # Fit checks run on whole minutes; datetimes are only built for actual blocks
+    start_minutes = avail.start_time.hour * 60 + avail.start_time.minute
+    window_minutes = avail.end_time.hour * 60 + avail.end_time.minute - start_minutes
+    daily_limit = plan_request.study_hours_per_day * 60
+    
+    # Available days in the two-week look-ahead, with their availability start
+    slots = []
+    for day_offset in range(14):
+        check_date = current_date + timedelta(days=day_offset)
+        if check_date.weekday() in allowed_days:
+            date_key = check_date.date()
+            slots.append((date_key, datetime.combine(date_key, avail.start_time)))
+    
+    # Track daily study minutes
+    daily_minutes = {}
+    # Slots before this index have used up their study time for good
+    first_open = 0
     
     for task in sorted_tasks:
         # Skip completed tasks
@@ -85,41 +98,24 @@ def generate_plan(plan_request: PlanRequest) -> List[TimeBlock]:
         duration_minutes = task.estimated_duration or 120
         
         # Find next available slot
-        scheduled = False
-        for day_offset in range(14):  # Look ahead 2 weeks
-            check_date = current_date + timedelta(days=day_offset)
-            day_name = check_date.strftime('%A').lower()
-            # Use the first availability entry (clients send a list)
-            if not plan_request.availability:
-                break
-            avail: Availability = plan_request.availability[0]
-
-            # Check if this day is available
-            if day_name not in avail.days:
-                continue
+        for date_key, day_start in slots[first_open:]:
+            # Check if we haven't exceeded daily study time
+            minutes_used = daily_minutes.get(date_key, 0)
             
-            # Check if we haven't exceeded daily study hours
-            date_key = check_date.date()
-            hours_used = daily_hours.get(date_key, 0)
+            if minutes_used >= daily_limit:
+                continue
             
-            if hours_used >= plan_request.study_hours_per_day:
+            # Check if block fits within availability
+            if minutes_used + duration_minutes > window_minutes:
                 continue
             
-            # Calculate start and end times from string availability
-            avail_start = _parse_time_str(avail.start_time)
-            avail_end = _parse_time_str(avail.end_time)
-
             # Create datetime objects for start and end
-            block_start = datetime.combine(check_date.date(), avail_start) + timedelta(hours=hours_used)
+            block_start = day_start + timedelta(minutes=minutes_used)
             block_end = block_start + timedelta(minutes=duration_minutes)
-
-            # Check if block fits within availability
-            available_end = datetime.combine(check_date.date(), avail_end)
-            if block_end > available_end:
-                continue
             
-            # Create time block
-            time_block = TimeBlock(
+            # Create time block. Every field comes from the already-validated
+            # PlanRequest or is computed here, so skip re-validation
+            time_block = TimeBlock.model_construct(
                 user_id=plan_request.user_id,
                 task_id=task.id,
                 title=task.title,
@@ -132,9 +128,11 @@ def generate_plan(plan_request: PlanRequest) -> List[TimeBlock]:
             
             time_blocks.append(time_block)
             
-            # Update daily hours
-            daily_hours[date_key] = hours_used + (duration_minutes / 60)
-            scheduled = True
+            # Update daily minutes
+            daily_minutes[date_key] = minutes_used + duration_minutes
             break
+        
+        while first_open < len(slots) and daily_minutes.get(slots[first_open][0], 0) >= daily_limit:
+            first_open += 1
     
     return time_blocks
@@ -0,0 +1,24 @@
+-- StudyFlow: index-friendly priority ordering for tasks
+-- The next-action fallback picks the user's most important open task. Ordering
+-- by the text `priority` column needed a CASE expression evaluated per row,
+-- which no index can serve. A stored numeric rank plus a partial index lets
+-- Postgres answer that query by reading the first matching index entry.
+
+-- ============================================================================
+-- TASKS: PRIORITY RANK
+-- ============================================================================
+-- low=1, medium=2, high=3, urgent=4
+ALTER TABLE tasks
+    ADD COLUMN priority_rank SMALLINT GENERATED ALWAYS AS (
+        CASE priority
+            WHEN 'urgent' THEN 4
+            WHEN 'high' THEN 3
+            WHEN 'medium' THEN 2
+            WHEN 'low' THEN 1
+        END
+    ) STORED;
+
+-- Open tasks only: completed/cancelled ones are never a next action
+CREATE INDEX idx_tasks_next_action
+    ON tasks(user_id, priority_rank DESC NULLS LAST, due_date ASC NULLS LAST)
+    WHERE status NOT IN ('completed', 'cancelled');
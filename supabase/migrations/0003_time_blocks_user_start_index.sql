@@ -0,0 +1,13 @@
+-- StudyFlow: composite index for per-user time block ranges
+-- /v1/tasks/today and /v1/next-action both filter time blocks by user and a
+-- start_time range, then order by start_time. Separate single-column indexes
+-- on user_id and start_time force a bitmap combine and a sort; one composite
+-- index returns the user's blocks already in start_time order.
+
+-- ============================================================================
+-- TIME_BLOCKS: (user_id, start_time)
+-- ============================================================================
+CREATE INDEX idx_time_blocks_user_start ON time_blocks(user_id, start_time);
+
+-- Any lookup by user_id alone is served by the composite index's prefix
+DROP INDEX IF EXISTS idx_time_blocks_user_id;
@@ -0,0 +1,13 @@
+-- StudyFlow: keyset pagination for the task list
+-- /v1/tasks pages through a user's tasks newest first. With LIMIT/OFFSET,
+-- Postgres reads and discards every skipped row, so deep pages get slower as
+-- the table grows. The cursor path seeks to (created_at, id) instead; this
+-- index serves both the seek and the ORDER BY.
+
+-- ============================================================================
+-- TASKS: (user_id, created_at DESC, id DESC)
+-- ============================================================================
+CREATE INDEX idx_tasks_user_created ON tasks(user_id, created_at DESC, id DESC);
+
+-- Any lookup by user_id alone is served by the composite index's prefix
+DROP INDEX IF EXISTS idx_tasks_user_id;
@@ -0,0 +1,15 @@
+-- StudyFlow: index-only existence checks for ICS sync
+-- The ICS sync probes a user's blocks by (start_time, end_time) for every
+-- imported slot. end_time is not in the (user_id, start_time) key, so each
+-- probe had to visit the heap to compare it. Carrying end_time (and
+-- is_completed, the other column filtered next to start_time) in the index
+-- leaves lets the probe run as an index-only scan.
+
+-- ============================================================================
+-- TIME_BLOCKS: (user_id, start_time) INCLUDE (end_time, is_completed)
+-- ============================================================================
+CREATE INDEX idx_time_blocks_user_start_incl
+    ON time_blocks(user_id, start_time) INCLUDE (end_time, is_completed);
+
+-- Same key columns; the new index replaces it
+DROP INDEX IF EXISTS idx_time_blocks_user_start;